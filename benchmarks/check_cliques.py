@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+#	check_cliques.py - check that the k-partite clique search of get_cliques finds the
+#		same cliques and ILP weights as networkx (get_cliques --networkx)
+#
+
+import argparse
+import contextlib
+import io
+import numpy as np
+import sys
+import tempfile
+
+from repic.commands.get_cliques import get_consensus_data, get_pairing_index
+from synthetic import make_dataset
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("--in_dir", type=str,
+                        help="path to input directory containing subdirectories of particle coordinate files (default: synthetic picker sets)")
+    parser.add_argument("--num_micrographs", type=int, default=5,
+                        help="number of synthetic micrographs (default: 5)")
+    parser.add_argument("--num_particles", type=int, default=300,
+                        help="number of synthetic picks per picker and micrograph (default: 300)")
+    parser.add_argument("--num_pickers", type=int, default=3,
+                        help="number of synthetic particle pickers (default: 3)")
+    parser.add_argument("--agreement", type=float, default=0.8,
+                        help="fraction of synthetic picks that are shared true particles (default: 0.8)")
+    parser.add_argument("--box_size", type=int, default=180,
+                        help="particle detection box size (in int[pixels]) (default: 180)")
+    parser.add_argument("--min_weight", type=float,
+                        help="prune cliques with an ILP weight below given value (float)")
+    parser.add_argument("--tile_size", type=int,
+                        help="find cliques of the k-partite search per spatial tile of given size (in int[pixels])")
+
+
+def get_cliques(box_files, methods, args, networkx=False):
+    """returns the ILP weight of each clique (tuple of member box IDs) of a micrograph"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        data, _ = get_consensus_data(box_files, methods, args.box_size, multi_out=True,
+                                     networkx=networkx,
+                                     tile_size=None if networkx else args.tile_size,
+                                     min_weight=args.min_weight)
+    if data is None:
+        return None
+
+    return {tuple(ids): weight for ids, weight in zip(data["ids"].tolist(), data["w"])}
+
+
+def check_cliques(in_dir, args):
+    """returns the number of micrographs with mismatching cliques and of all micrographs"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        methods, index = get_pairing_index(in_dir)
+    mismatches = 0
+    for basename, box_files in index.items():
+        cliques = get_cliques(box_files, methods, args)
+        if cliques is None:
+            print(f"{basename}: not all methods have picked particles - skipping")
+            continue
+        reference = get_cliques(box_files, methods, args, networkx=True)
+        match = set(cliques) == set(reference) and np.allclose(
+            [cliques[key] for key in reference], list(reference.values()), rtol=1e-6)
+        mismatches += not match
+        print(f"{basename}: {len(cliques)} / {len(reference)} cliques (k-partite / networkx)",
+              "- identical" if match else "- MISMATCH")
+
+    return mismatches, len(index)
+
+
+def main(args):
+    if args.in_dir:
+        mismatches, total = check_cliques(args.in_dir, args)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            make_dataset(tmp_dir, args.num_micrographs, args.num_particles, args.num_pickers,
+                         args.agreement, args.box_size)
+            mismatches, total = check_cliques(tmp_dir, args)
+
+    print(f"{mismatches} of {total} micrographs with mismatching cliques")
+    if mismatches > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+#	check_matching.py - check that the bipartite matching backend of two-picker problems
+#		finds solutions of the same objective value as HiGHS
+#
+
+import argparse
+import glob
+import numpy as np
+import os
+import sys
+
+from repic.utils.common import read_ilp_data
+from repic.utils.solvers import get_matching_pairs, solve_highs, solve_matching
+from scipy.sparse import csc_matrix
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("--in_dir", type=str,
+                        help="path to get_cliques output directory of two pickers (default: random bipartite graphs)")
+    parser.add_argument("--num_instances", type=int, default=100,
+                        help="number of random bipartite graphs (default: 100)")
+    parser.add_argument("--num_vertices", type=int, default=50,
+                        help="maximum number of vertices per side of random bipartite graphs (default: 50)")
+    parser.add_argument("--density", type=float, default=0.1,
+                        help="edge probability of random bipartite graphs (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random number generator seed (default: 0)")
+
+
+def get_random_problem(num_vertices, density, rng):
+    """returns constraint matrix and weight vector of a random bipartite matching problem"""
+    n_left, n_right = rng.integers(1, num_vertices + 1, 2)
+    left, right = np.nonzero(rng.random((n_left, n_right)) < density)
+    #	vertices of the first picker are followed by those of the second picker
+    rows = np.column_stack([left, n_left + right]).ravel()
+    n = len(left)
+    A = csc_matrix((np.ones(2 * n), rows, np.arange(0, 2 * n + 1, 2)),
+                   shape=(n_left + n_right, n))
+    #	include non-positive weights, which are never chosen
+    w = rng.uniform(-0.1, 1., n).astype(np.float32)
+
+    return A, w
+
+
+def get_problems(args):
+    """yields names, constraint matrices, and weight vectors of the problems to check"""
+    if args.in_dir:
+        for in_file in sorted(glob.glob(os.path.join(args.in_dir, "*_cliques.bin"))):
+            data = read_ilp_data(in_file)
+            yield os.path.basename(in_file)[:-len("_cliques.bin")], data["A"], data["w"]
+        return
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.num_instances):
+        yield (f"instance_{i:05d}", *get_random_problem(args.num_vertices, args.density, rng))
+
+
+def main(args):
+    counts = {"identical": 0, "tie": 0, "mismatch": 0, "skipped": 0}
+    for name, A, w in get_problems(args):
+        if A.shape[1] == 0 or get_matching_pairs(A) is None:
+            counts["skipped"] += 1
+            continue
+        x, _ = solve_matching(A, w)
+        reference, _ = solve_highs(A, w)
+        objective, reference_objective = np.dot(w, x), np.dot(w, reference)
+        if np.max(A @ x, initial=0) > 1 or not np.isclose(objective, reference_objective,
+                                                          rtol=1e-6):
+            key = "mismatch"
+            print(f"{name}: objective {objective:.6f} / {reference_objective:.6f}",
+                  "(matching / HiGHS) - MISMATCH")
+        elif np.array_equal(x, reference):
+            key = "identical"
+        else:
+            #	equal objective values - the solvers chose another optimal solution
+            key = "tie"
+        counts[key] += 1
+
+    print(', '.join([f"{val} {key}" for key, val in counts.items()]),
+          "(skipped: not a bipartite matching problem)")
+    if counts["mismatch"] > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+#	compare_formats.py - check that run_ilp writes the same consensus files from the
+#		previous get_cliques layout (four pickle files) and from consensus files
+#
+
+import argparse
+import contextlib
+import glob
+import io
+import numpy as np
+import os
+import sys
+import tempfile
+
+from repic.commands.run_ilp import get_ilp_basename, solve_ilp, write_consensus
+from repic.utils.common import read_ilp_data
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("legacy_dir",
+                        help="path to get_cliques output directory of the previous layout (*_constraint_matrix.pickle)")
+    parser.add_argument("in_dir",
+                        help="path to get_cliques output directory of the same micrographs (*_cliques.bin)")
+    parser.add_argument("box_size", type=int,
+                        help="particle detection box size (in int[pixels])")
+    parser.add_argument("--num_particles", type=int,
+                        help="filter for the number of expected particles (int)")
+
+
+def solve(in_file, out_prefix, args):
+    """returns the sorted consensus file lines and objective value of a get_cliques output file"""
+    data = read_ilp_data(in_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        x = solve_ilp(data["A"], data["w"])
+    out_file = write_consensus(out_prefix, data, x, args.box_size,
+                               args.num_particles)
+    with open(out_file, 'rt') as f:
+        lines = sorted(f.read().splitlines())
+
+    return lines, float(np.dot(data["w"], x))
+
+
+def main(args):
+    in_files = {get_ilp_basename(val): val for val in glob.glob(
+        os.path.join(args.in_dir, "*_cliques.bin"))}
+    counts = {"identical": 0, "tie": 0, "mismatch": 0}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for legacy_file in sorted(glob.glob(os.path.join(args.legacy_dir, "*_constraint_matrix.pickle"))):
+            basename = get_ilp_basename(legacy_file)
+            if not basename in in_files:
+                print(f"{basename}: no consensus file found - skipping")
+                continue
+            legacy_lines, legacy_objective = solve(legacy_file,
+                                                   os.path.join(tmp_dir, "legacy"), args)
+            lines, objective = solve(in_files[basename],
+                                     os.path.join(tmp_dir, "consensus"), args)
+            if legacy_lines == lines:
+                key = "identical"
+            elif np.isclose(legacy_objective, objective, rtol=1e-6):
+                #	equal objective values - the solver chose another optimal solution
+                key = "tie"
+            else:
+                key = "mismatch"
+            counts[key] += 1
+            print(f"{basename}: {len(legacy_lines)} / {len(lines)} lines,",
+                  f"objective {legacy_objective:.6f} / {objective:.6f} - {key}")
+
+    print(', '.join([f"{val} {key}" for key, val in counts.items()]))
+    if counts["mismatch"] > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
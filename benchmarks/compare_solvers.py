@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+#	compare_solvers.py - compare runtimes and objective values of the run_ilp solver
+#		backends on get_cliques output or synthetic picker sets
+#
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import numpy as np
+import os
+import tempfile
+import time
+
+from repic.commands.get_cliques import get_consensus_data, get_pairing_index
+from repic.commands.run_ilp import solve_ilp
+from repic.utils.common import read_ilp_data
+from repic.utils.solvers import SolverPool, gurobi_available
+from synthetic import make_dataset
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("--in_dir", type=str,
+                        help="path to get_cliques output directory (default: synthetic picker sets)")
+    parser.add_argument("--solvers", type=str, nargs='+', default=["gurobi", "highs"],
+                        help="solver backends to compare (default: gurobi highs)")
+    parser.add_argument("--out_file", type=str, default="solver_results.json",
+                        help="path to output JSON file (default: ./solver_results.json)")
+    parser.add_argument("--num_micrographs", type=int, default=10,
+                        help="number of synthetic micrographs (default: 10)")
+    parser.add_argument("--num_particles", type=int, default=1000,
+                        help="number of synthetic picks per picker and micrograph (default: 1000)")
+    parser.add_argument("--num_pickers", type=int, default=3,
+                        help="number of synthetic particle pickers (default: 3)")
+    parser.add_argument("--agreement", type=float, default=0.8,
+                        help="fraction of synthetic picks that are shared true particles (default: 0.8)")
+    parser.add_argument("--box_size", type=int, default=180,
+                        help="particle detection box size (in int[pixels]) (default: 180)")
+
+
+def get_backend_label(result):
+    """returns the backends that solved the subproblems of a micrograph"""
+    return ','.join(sorted(result["backends"])) if result["backends"] else "closed form"
+
+
+def get_models(args):
+    """yields micrograph basenames and ILP data structures (see read_ilp_data())"""
+    if args.in_dir:
+        for in_file in sorted(glob.glob(os.path.join(args.in_dir, "*_cliques.bin"))):
+            yield os.path.basename(in_file)[:-len("_cliques.bin")], read_ilp_data(in_file)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_dataset(tmp_dir, args.num_micrographs, args.num_particles, args.num_pickers,
+                     args.agreement, args.box_size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            methods, index = get_pairing_index(tmp_dir)
+        for basename, box_files in index.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                data, _ = get_consensus_data(box_files, methods, args.box_size)
+            yield basename, data
+
+
+def main(args):
+    solvers = [val for val in args.solvers if val != "gurobi" or gurobi_available()]
+    if len(solvers) < len(args.solvers):
+        print("Gurobi is not installed or licensed - skipping Gurobi backend")
+    results = {"solvers": solvers, "micrographs": []}
+    #	one solver pool for all models - Gurobi environments are started once
+    with SolverPool() as pool:
+        for basename, data in get_models(args):
+            result = {"micrograph": basename, "num_cliques": len(data["w"])}
+            for solver in solvers:
+                metrics = {}
+                start = time.time()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    x = solve_ilp(data["A"], data["w"], pool=pool, metrics=metrics,
+                                  solver=solver)
+                result[solver] = {"total": time.time() - start,
+                                  "solve": metrics["stages"].get("solve", 0.),
+                                  "objective": float(np.dot(data["w"], x)),
+                                  "backends": metrics["solver"]["backends"],
+                                  "status": metrics["solver"]["status"]}
+            objectives = [result[solver]["objective"] for solver in solvers]
+            result["match"] = bool(np.allclose(objectives, objectives[0], rtol=1e-6))
+            results["micrographs"].append(result)
+            #	label results with the backends that ran - e.g., two-picker problems are
+            #		solved by bipartite matching for every requested solver
+            print(f"{basename} ({result['num_cliques']} cliques):",
+                  ', '.join([f"{solver} [{get_backend_label(result[solver])}] {result[solver]['total']:.4f} s "
+                             f"(objective {result[solver]['objective']:.4f})" for solver in solvers]),
+                  "" if result["match"] else "- OBJECTIVE MISMATCH")
+
+    print("Total runtime (in seconds):")
+    for solver in solvers:
+        print(f"\t{solver}: {np.sum([val[solver]['total'] for val in results['micrographs']]):.4f}")
+    mismatches = sum([not val["match"] for val in results["micrographs"]])
+    print(f"{mismatches} of {len(results['micrographs'])} micrographs with mismatching objective values")
+    for solver in solvers:
+        other = sum([set(val[solver]["backends"]) - {solver} != set()
+                     for val in results["micrographs"]])
+        if other > 0:
+            print(f"\t{other} micrographs requested with {solver} were (partly) solved by other",
+                  "backends (see backends in results)")
+    with open(args.out_file, 'wt') as o:
+        json.dump(results, o, indent=1)
+    print("Results written to:", args.out_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+#
+#	run_benchmarks.py - benchmark get_cliques and run_ilp stages on synthetic picker sets
+#		and compare results against a saved baseline
+#
+
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import repic
+
+from repic.commands.get_cliques import get_consensus_data, get_pairing_index
+from repic.commands.run_ilp import solve_ilp, write_consensus
+from repic.utils.common import get_peak_rss, write_ilp_data
+from repic.utils.solvers import SolverPool
+from synthetic import make_dataset
+
+#	benchmark parameters varied one at a time around the base scenario
+base = {"num_particles": 1000, "num_pickers": 3,
+        "agreement": 0.8, "num_micrographs": 10}
+grid = {"num_particles": [250, 1000, 4000], "num_pickers": [2, 3, 4],
+        "agreement": [0.5, 0.8, 0.95], "num_micrographs": [10, 40]}
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("--out_file", type=str, default="benchmark_results.json",
+                        help="path to output JSON file (default: ./benchmark_results.json)")
+    parser.add_argument("--baseline", type=str,
+                        help="path to JSON file of previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown / memory increase reported as a regression (default: 0.2)")
+    parser.add_argument("--min_time", type=float, default=0.01,
+                        help="minimum absolute slowdown (in seconds) reported as a regression (default: 0.01)")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="number of timed repeats per scenario - fastest is kept (default: 3)")
+    parser.add_argument("--box_size", type=int, default=180,
+                        help="particle detection box size (in int[pixels]) (default: 180)")
+    parser.add_argument("--quick", action="store_true",
+                        help="only run the base scenario on 3 micrographs")
+    for key, vals in grid.items():
+        parser.add_argument(f"--{key}", type=type(vals[0]), nargs='+',
+                            help=f"values of {key} to benchmark (default: {' '.join([str(val) for val in vals])})")
+
+
+def get_scenarios(args):
+    """returns benchmark scenarios varying one parameter of the base scenario each"""
+    if args.quick:
+        return [dict(base, num_micrographs=3)]
+    scenarios = []
+    for key, vals in grid.items():
+        vals = getattr(args, key) if getattr(args, key) else vals
+        for val in vals:
+            scenario = dict(base, **{key: val})
+            if not scenario in scenarios:
+                scenarios.append(scenario)
+
+    return scenarios
+
+
+def get_scenario_name(scenario):
+    """returns short name of a benchmark scenario"""
+    return "p{num_particles}_k{num_pickers}_a{agreement}_m{num_micrographs}".format(**scenario)
+
+
+def run_consensus(in_dir, out_dir, box_size):
+    """returns summed stage timings (in seconds) and counts of a consensus run"""
+    methods, index = get_pairing_index(in_dir)
+    stages, counts = {}, {"num_nodes": 0, "num_edges": 0, "num_cliques": 0}
+    with SolverPool() as pool:
+        for basename, box_files in index.items():
+            metrics = {}
+            data, _ = get_consensus_data(box_files, methods, box_size, metrics=metrics)
+            start = time.time()
+            write_ilp_data(os.path.join(out_dir, ''.join(
+                [basename, "_cliques.bin"])), data)
+            metrics["stages"]["write_cliques"] = time.time() - start
+            x = solve_ilp(data["A"], data["w"], pool=pool, metrics=metrics)
+            start = time.time()
+            write_consensus(os.path.join(out_dir, basename), data, x, box_size)
+            metrics["stages"]["write_consensus"] = time.time() - start
+            for key, val in metrics["stages"].items():
+                stages[key] = stages.get(key, 0.) + val
+            counts["num_nodes"] += sum(metrics["num_nodes"])
+            counts["num_edges"] += metrics["num_edges"]
+            counts["num_cliques"] += metrics["num_cliques"]
+
+    return stages, counts
+
+
+def get_stage_memory(in_dir, out_dir, box_size):
+    """returns peak traced memory (in MB) of the get_cliques and run_ilp stages"""
+    methods, index = get_pairing_index(in_dir)
+    memory = {"get_cliques": 0., "run_ilp": 0.}
+    for basename, box_files in index.items():
+        tracemalloc.start()
+        data, _ = get_consensus_data(box_files, methods, box_size)
+        write_ilp_data(os.path.join(out_dir, ''.join(
+            [basename, "_cliques.bin"])), data)
+        current, peak = tracemalloc.get_traced_memory()
+        memory["get_cliques"] = max(memory["get_cliques"], peak / 2 ** 20)
+        #	restart tracing to reset the peak (tracemalloc.reset_peak() requires Python
+        #		3.9) - memory held from the previous stage is added back
+        tracemalloc.stop()
+        tracemalloc.start()
+        x = solve_ilp(data["A"], data["w"])
+        write_consensus(os.path.join(out_dir, basename), data, x, box_size)
+        memory["run_ilp"] = max(memory["run_ilp"],
+                                (current + tracemalloc.get_traced_memory()[1]) / 2 ** 20)
+        tracemalloc.stop()
+
+    return memory
+
+
+def run_scenario(scenario, box_size, repeats):
+    """returns benchmark results of a scenario"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        in_dir, out_dir = os.path.join(
+            tmp_dir, "in"), os.path.join(tmp_dir, "out")
+        os.makedirs(out_dir)
+        make_dataset(in_dir, box_size=box_size, **scenario)
+        #	silence per-micrograph progress messages
+        with contextlib.redirect_stdout(io.StringIO()):
+            runs = []
+            for _ in range(max(repeats, 1)):
+                start = time.time()
+                stages, counts = run_consensus(in_dir, out_dir, box_size)
+                runs.append((time.time() - start, stages))
+            memory = get_stage_memory(in_dir, out_dir, box_size)
+    total, stages = min(runs, key=lambda val: val[0])
+
+    return {"name": get_scenario_name(scenario), "params": scenario, "total": total,
+            "stages": stages, "counts": counts, "memory_mb": memory,
+            "throughput": {"micrographs_per_s": scenario["num_micrographs"] / total,
+                           "picks_per_s": {key: counts["num_nodes"] / val
+                                           for key, val in stages.items() if val > 0}}}
+
+
+def compare_results(results, baseline, tolerance, min_time):
+    """prints changes relative to baseline results and returns the number of regressions"""
+    previous = {val["name"]: val for val in baseline["scenarios"]}
+    regressions = 0
+    print(f"\nComparison against baseline ({baseline['meta']['date']}):")
+    for result in results["scenarios"]:
+        if not result["name"] in previous:
+            print(f"\t{result['name']}: not found in baseline")
+            continue
+        prev = previous[result["name"]]
+        pairs = [("total", result["total"], prev["total"], min_time)] + \
+            [(key, val, prev["stages"][key], min_time) for key, val in result["stages"].items()
+             if key in prev["stages"]] + \
+            [(f"memory_mb:{key}", val, prev["memory_mb"][key], 1.) for key, val
+             in result["memory_mb"].items() if key in prev["memory_mb"]]
+        for key, val, prev_val, min_diff in pairs:
+            ratio = val / prev_val if prev_val > 0 else np.inf
+            if ratio > 1. + tolerance and val - prev_val > min_diff:
+                regressions += 1
+                print(f"\t{result['name']} - {key}: {prev_val:.4f} -> {val:.4f}",
+                      f"({ratio:.2f}x) REGRESSION")
+            elif key == "total":
+                print(f"\t{result['name']} - {key}: {prev_val:.4f} -> {val:.4f}",
+                      f"({ratio:.2f}x)")
+
+    return regressions
+
+
+def main(args):
+    results = {"meta": {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "repic": repic.__version__,
+                        "python": platform.python_version(), "numpy": np.__version__,
+                        "platform": platform.platform(), "box_size": args.box_size,
+                        "repeats": args.repeats},
+               "scenarios": []}
+    for scenario in get_scenarios(args):
+        result = run_scenario(scenario, args.box_size, args.repeats)
+        results["scenarios"].append(result)
+        print(f"{result['name']}: {result['total']:.3f} s,",
+              f"{result['throughput']['micrographs_per_s']:.2f} micrographs/s,",
+              f"peak memory {max(result['memory_mb'].values()):.1f} MB")
+        print('\t' + ', '.join([f"{key}: {val:.4f} s" for key, val
+                                in result["stages"].items()]))
+    results["meta"]["peak_rss_mb"] = get_peak_rss()
+
+    with open(args.out_file, 'wt') as o:
+        json.dump(results, o, indent=1)
+    print("Results written to:", args.out_file)
+
+    if args.baseline:
+        with open(args.baseline, 'rt') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance,
+                                      args.min_time)
+        print(f"{regressions} regressions found")
+        if regressions > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
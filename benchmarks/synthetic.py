@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+#	synthetic.py - generate synthetic picker BOX files for benchmarking the consensus engine
+#
+
+import argparse
+import numpy as np
+import os
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("out_dir",
+                        help="path to output directory (one subdirectory of BOX files per picker)")
+    parser.add_argument("--num_micrographs", type=int, default=10,
+                        help="number of micrographs (default: 10)")
+    parser.add_argument("--num_particles", type=int, default=1000,
+                        help="number of picks per picker and micrograph (default: 1000)")
+    parser.add_argument("--num_pickers", type=int, default=3,
+                        help="number of particle pickers (default: 3)")
+    parser.add_argument("--agreement", type=float, default=0.8,
+                        help="fraction of picks that are shared true particles (default: 0.8)")
+    parser.add_argument("--box_size", type=int, default=180,
+                        help="particle detection box size (in int[pixels]) (default: 180)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random number generator seed (default: 0)")
+
+
+def get_micrograph_size(num_particles, box_size):
+    """returns the side length (in pixels) of a micrograph of given number of particles"""
+    return int(np.ceil(np.sqrt(4 * num_particles) * box_size))
+
+
+def make_picks(particles, num_particles, agreement, box_size, size, rng):
+    """returns (x, y, confidence) picks of one picker"""
+    num_true = min(int(round(num_particles * agreement)), len(particles))
+    true = particles[rng.choice(len(particles), num_true, replace=False)] + \
+        rng.normal(0., 0.05 * box_size, (num_true, 2))
+    false = rng.uniform(0., size - box_size, (num_particles - num_true, 2))
+    coords = np.clip(np.vstack([true, false]), 0., size - box_size)
+    confidences = np.concatenate([rng.beta(5., 2., num_true),
+                                  rng.beta(2., 5., num_particles - num_true)])
+    order = np.argsort(-confidences, kind="stable")
+
+    return coords[order], confidences[order]
+
+
+def make_dataset(out_dir, num_micrographs=10, num_particles=1000, num_pickers=3,
+                 agreement=0.8, box_size=180, seed=0):
+    """writes synthetic BOX files of each picker and micrograph and returns the micrograph size"""
+    assert(0. <= agreement <= 1.), "Error - agreement must be between 0 and 1"
+    rng = np.random.default_rng(seed)
+    size = get_micrograph_size(num_particles, box_size)
+    pickers = [f"picker_{i}" for i in range(num_pickers)]
+    for picker in pickers:
+        os.makedirs(os.path.join(out_dir, picker), exist_ok=True)
+
+    for i in range(num_micrographs):
+        #	true particles shared by all pickers
+        particles = rng.uniform(0., size - box_size, (num_particles, 2))
+        for picker in pickers:
+            coords, confidences = make_picks(particles, num_particles, agreement,
+                                             box_size, size, rng)
+            out_file = os.path.join(out_dir, picker, f"micrograph_{i:05d}.box")
+            with open(out_file, 'wt') as o:
+                o.write('\n'.join(['\t'.join([str(int(np.rint(x))), str(int(np.rint(y))),
+                                              str(box_size), str(box_size), f"{conf:.6f}"])
+                                   for (x, y), conf in zip(coords, confidences)]) + '\n')
+
+    return size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    size = make_dataset(args.out_dir, args.num_micrographs, args.num_particles,
+                        args.num_pickers, args.agreement, args.box_size, args.seed)
+    print(f"Synthetic BOX files written to {args.out_dir} ({size}x{size} pixel micrographs)")
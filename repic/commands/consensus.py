@@ -0,0 +1,126 @@
+#!/usr/local/bin/python3
+#
+#	consensus.py - find particle cliques and optimal consensus particles for each micrograph
+#		in a single pass (get_cliques + run_ilp without intermediate files)
+#
+
+from concurrent.futures import ProcessPoolExecutor
+
+from repic.commands.get_cliques import check_clique_arguments, find_micrograph_cliques, \
+    get_micrograph_size, get_pairing_index
+from repic.commands.run_ilp import check_solver_arguments, solve_ilp, write_outputs, write_summary
+from repic.utils.common import *
+from repic.utils.solvers import SolverPool, backends, get_solve_threads
+
+name = "consensus"
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("in_dir",
+                        help="path to input directory containing subdirectories of particle coordinate files")
+    parser.add_argument("out_dir",
+                        help="path to output directory (WARNING - script will delete directory if it exists)")
+    parser.add_argument("box_size", type=int,
+                        help="particle detection box size (in int[pixels])")
+    parser.add_argument("--num_particles", type=int,
+                        help="filter for the number of expected particles (int)")
+    parser.add_argument("--prune_cliques", action="store_true",
+                        help="prune cliques whose ILP weight cannot reach the weight of the N-th (--num_particles) best disjoint clique")
+    parser.add_argument("--multi_out", action="store_true",
+                        help="set output of cliques to be members sorted by picker name")
+    parser.add_argument("--get_cc", action="store_true",
+                        help="filters cliques for those in the largest Connected Component (CC)")
+    parser.add_argument("--min_weight", type=float,
+                        help="prune cliques with an ILP weight below given value during clique search (float)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of micrographs to process in parallel (default: 1)")
+    parser.add_argument("--tile_size", type=int,
+                        help="split micrographs into square spatial tiles of given size (in int[pixels]) to find cliques per tile")
+    parser.add_argument("--tile_jobs", type=int, default=1,
+                        help="number of spatial tiles of a micrograph to process in parallel (default: 1)")
+    parser.add_argument("--cc_jobs", type=int, default=1,
+                        help="number of connected components of cliques to solve in parallel (default: 1)")
+    parser.add_argument("--threads_per_solve", "--threads-per-solve", type=int, dest="threads_per_solve",
+                        help="number of Gurobi threads per solve - capped so that concurrent solves share the available cores (default: cores / (jobs x cc_jobs))")
+    parser.add_argument("--solver", type=str, choices=backends, default="auto",
+                        help="ILP solver backend - auto uses Gurobi if available and HiGHS otherwise (default: auto)")
+    parser.add_argument("--relaxation_gap", type=float,
+                        help="try LP relaxation and greedy packing before the ILP solver and accept solutions within given relative gap of the LP bound (float)")
+    parser.add_argument("--time_limit", type=float,
+                        help="ILP solver time limit per micrograph (in seconds) - the best solution found is written when reached (float)")
+    parser.add_argument("--mip_gap", type=float,
+                        help="relative MIP gap at which the ILP solver stops (float)")
+    parser.add_argument("--batch_size", type=int,
+                        help="solve connected components of cliques in block-diagonal models of up to given number of cliques (int)")
+    parser.add_argument("--debug", action="store_true",
+                        help="write intermediate get_cliques files (*_cliques.bin) to output directory")
+
+
+def process_micrograph(basename, box_files, methods, pool, args, threads=0):
+    """finds and writes the consensus particles of a micrograph and returns its solver summary"""
+    data, components, metrics, start = find_micrograph_cliques(
+        basename, box_files, methods, args, name,
+        args.num_particles if args.prune_cliques else None)
+    if data is None:
+        return None
+
+    if args.debug:
+        stage_start = time.time()
+        write_ilp_data(os.path.join(args.out_dir, ''.join(
+            [basename, "_cliques.bin"])), data)
+        add_stage_time(metrics["stages"], "write_cliques", stage_start)
+
+    print("Solving ILP ... ")
+    x = solve_ilp(data["A"], data["w"], pool=pool, metrics=metrics,
+                  solver=args.solver, relaxation_gap=args.relaxation_gap,
+                  batch_size=args.batch_size, threads=threads, time_limit=args.time_limit,
+                  mip_gap=args.mip_gap)
+    write_outputs(args.out_dir, basename, data, x, metrics, start, args, name, components)
+
+    return metrics["solver"]
+
+
+def process_micrographs(basenames, index, methods, args, threads=0):
+    """returns the solver summaries of micrographs processed with a shared solver pool"""
+    with SolverPool(args.cc_jobs) as pool:
+        return [(basename, process_micrograph(basename, index[basename], methods, pool,
+                                              args, threads)) for basename in basenames]
+
+
+def main(args):
+    check_clique_arguments(args)
+    check_solver_arguments(args)
+    assert(not args.prune_cliques or (not args.num_particles is None and args.num_particles >
+           0)), "Error - --prune_cliques requires a positive --num_particles value"
+
+    #	set up output directory
+    del_dir(args.out_dir)
+    create_dir(args.out_dir)
+    methods, index = get_pairing_index(args.in_dir)
+    threads = get_solve_threads(args.jobs * args.cc_jobs, args.threads_per_solve)
+
+    #	stream micrographs one at a time (per worker)
+    basenames = list(index)
+    summaries = []
+    if args.jobs > 1:
+        #	one group of micrographs per worker (and solver pool), balanced by total
+        #		BOX file size
+        groups = get_job_groups(basenames, [get_micrograph_size(index[val])
+                                            for val in basenames], args.jobs)
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(process_micrographs, group, index, methods, args,
+                                       threads) for group in groups]
+            for future in futures:
+                summaries.extend(future.result())
+    else:
+        summaries = process_micrographs(basenames, index, methods, args, threads)
+    write_summary(os.path.join(args.out_dir, "non_optimal.tsv"),
+                  [val for val in summaries if not val[1] is None])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
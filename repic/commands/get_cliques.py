@@ -4,13 +4,21 @@
 #	author: Christopher JF Cameron
 #
 
+import hashlib
 import itertools
-import networkx as nx
+
+from concurrent.futures import ProcessPoolExecutor
 
 from repic.utils.common import *
-from scipy.sparse import coo_matrix
+from repic.utils.consensus_graph import ConsensusGraph
+from repic.utils.solvers import greedy_packing
+from scipy.sparse import csc_matrix
 
 name = "get_cliques"
+#	minimum Jaccard index of detection pairs (graph edges)
+threshold = 0.3
+#	suffixes of per-micrograph output files (incl. run_ilp output)
+out_suffixes = ["_cliques.bin", "_runtime.tsv", "_metrics.json", ".box", ".tsv"]
 
 
 def add_arguments(parser):
@@ -25,208 +33,687 @@ def add_arguments(parser):
                         help="set output of cliques to be members sorted by picker name")
     parser.add_argument("--get_cc", action="store_true",
                         help="filters cliques for those in the largest Connected Component (CC)")
-
-
-def add_nodes_to_graph(graph, node_pairs, node_names):
-    """adds nodes and their edge to a given graph"""
-    global node_id
-    for x, y, weight_1, id_1, a, b, weight_2, id_2, jaccard in node_pairs:
-        graph.add_node((x, y, id_1), name=node_names[0], weight=weight_1)
-        graph.add_node((a, b, id_2), name=node_names[1], weight=weight_2)
-        graph.add_edge((x, y, id_1), (a, b, id_2),
-                       weight=jaccard)  # weight attribute used by nx
-
-
-def calc_jaccard(x, y, a, b, box_size):
-    """returns Jaccard Index for coord A (x,y) and coord B (a,b) with box size"""
-    x_overlap = np.max([(np.min([x, a]) + box_size - np.max([x, a])), 0])
-    y_overlap = np.max([(np.min([y, b]) + box_size - np.max([y, b])), 0])
+    parser.add_argument("--min_weight", type=float,
+                        help="prune cliques with an ILP weight below given value during clique search (float)")
+    parser.add_argument("--prune_cliques", type=int, metavar="NUM_PARTICLES",
+                        help="prune cliques whose ILP weight cannot reach the weight of the N-th best disjoint clique (int)")
+    parser.add_argument("--networkx", action="store_true",
+                        help="enumerate cliques with networkx instead of the k-partite search (slow, for debugging)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of micrographs to process in parallel (default: 1)")
+    parser.add_argument("--tile_size", type=int,
+                        help="split micrographs into square spatial tiles of given size (in int[pixels]) to find cliques per tile")
+    parser.add_argument("--tile_jobs", type=int, default=1,
+                        help="number of spatial tiles of a micrograph to process in parallel (default: 1)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep output directory and only process micrographs with new or changed BOX files / parameters")
+
+
+def calc_jaccard(coords_a, coords_b, i, j, box_size):
+    """returns Jaccard Indices for coord pairs A[i] (x,y) and B[j] (a,b) with box size"""
+    x, y = coords_a[i, 0], coords_a[i, 1]
+    a, b = coords_b[j, 0], coords_b[j, 1]
+    x_overlap = np.maximum(np.minimum(x, a) + box_size - np.maximum(x, a), 0)
+    y_overlap = np.maximum(np.minimum(y, b) + box_size - np.maximum(y, b), 0)
     jaccard = x_overlap * y_overlap
 
     return jaccard / ((2 * box_size ** 2) - jaccard)
 
 
-def find_cliques(G, k):
-    """returns cliques in graph G of size k"""
-    cliques = set()
-    for clique in nx.find_cliques(G):
-        if len(clique) == k:
-            cliques.add(tuple(sorted(clique)))
+def extend_cliques(graph, cliques, order, min_weight=None, bounds=None, chunk_size=2 ** 18):
+    """returns cliques extended from (n, q) partial cliques with one member per picker"""
+    for q in range(cliques.shape[1], graph.k):
+        if len(cliques) > chunk_size:
+            #	extend a bounded number of partial cliques at a time to limit memory usage
+            return np.vstack([extend_cliques(graph, cliques[i:i + chunk_size], order, min_weight,
+                                             None if bounds is None else (bounds[0][i:i + chunk_size],
+                                                                          bounds[1][i:i + chunk_size]) + bounds[2:],
+                                             chunk_size) for i in range(0, len(cliques), chunk_size)])
+        #	extend each partial clique with the picker neighbours of its anchor ...
+        starts, ends = graph.neighbour_ranges(cliques[:, 0], order[q])
+        counts = ends - starts
+        pos = np.arange(np.sum(counts)) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+        edges = [np.repeat(starts, counts) + pos]
+        parents = np.repeat(np.arange(len(cliques)), counts)
+        cliques = np.column_stack([cliques[parents], graph.indices[edges[0]]])
+        #	... and keep those adjacent to all other members
+        for p in range(1, q):
+            idx = graph.edge_index(cliques[:, p], cliques[:, q])
+            keep = idx >= 0
+            cliques, parents = cliques[keep], parents[keep]
+            edges = [val[keep] for val in edges] + [idx[keep]]
+        if not min_weight is None:
+            #	prune partial cliques that cannot reach the minimum weight
+            rows, weights, max_confidences, max_jaccards = bounds
+            rows = rows[parents]
+            weights = np.hstack([weights[parents], graph.weights[np.column_stack(edges)]])
+            keep = get_weight_bound(graph, cliques, weights, max_confidences[rows][:, order[q + 1:]],
+                                    max_jaccards[rows][:, order[q + 1:]]) >= min_weight - 1e-6
+            cliques = cliques[keep]
+            bounds = (rows[keep], weights[keep], max_confidences, max_jaccards)
 
     return cliques
 
 
-def get_jaccard(set_a, set_b, box_size, threshold):
-    """returns the Jaccard indices > 0 b/w two sets"""
-    vals = []
-    for x, y, weight_1, id_1 in set_a:
-        for a, b, weight_2, id_2 in set_b:
-            if ((np.abs(x - a) <= box_size) and
-                    ((jaccard := calc_jaccard(x, y, a, b, box_size)) > threshold)):
-                vals.append(
-                    tuple([x, y, weight_1, id_1, a, b, weight_2, id_2, jaccard]))
+def find_budget_cliques(graph, num_particles, min_weight=None, chunk_size=2 ** 18):
+    """returns cliques (see find_cliques()) that can reach the budget weight (see get_budget_weight())"""
+    if graph.k < 2:
+        return find_cliques(graph, min_weight, chunk_size)
+
+    #	disjoint cliques have distinct anchors, so the num_particles-th largest anchor
+    #		weight bound is an upper bound of the budget weight
+    order = np.argsort(np.diff(graph.offsets), kind="stable")
+    anchors = np.arange(graph.offsets[order[0]], graph.offsets[order[0] + 1],
+                        dtype=np.int64)
+    max_confidences, max_jaccards = get_anchor_bounds(graph, anchors)
+    bounds = np.sort(get_weight_bound(graph, anchors[:, None], np.empty((len(anchors), 0)),
+                                      max_confidences[:, order[1:]], max_jaccards[:, order[1:]]))[::-1]
+    bound = bounds[num_particles - 1] if len(bounds) >= num_particles else 0.
+    if bound > (0. if min_weight is None else min_weight):
+        cliques = find_cliques(graph, bound, chunk_size)
+        w = get_clique_weights(graph, cliques)[0]
+        keep = w >= bound
+        #	greedy packing picks cliques heaviest first, so cliques below the bound do
+        #		not change the budget weight once num_particles cliques are packed
+        if get_budget_weight(cliques[keep], w[keep], num_particles) >= bound:
+            return cliques
+
+    #	fewer than num_particles cliques reach the bound - a single search without the
+    #		bound is cheaper than repeated searches with lower bounds
+    return find_cliques(graph, min_weight, chunk_size)
+
+
+def find_cliques(graph, min_weight=None, chunk_size=2 ** 18):
+    """returns (n, k) array of cliques with one member per picker in lexicographic order"""
+    if graph.k < 2:
+        return np.empty((0, graph.k), dtype=np.int64)
+
+    #	search pickers from the fewest to the most picks to keep the number of partial
+    #		cliques small - search order picker 0 members are the clique anchors
+    order = np.argsort(np.diff(graph.offsets), kind="stable")
+    anchors = np.arange(graph.offsets[order[0]], graph.offsets[order[0] + 1],
+                        dtype=np.int64)
+    bounds = None
+    if not min_weight is None:
+        bounds = (np.arange(len(anchors)), np.empty((len(anchors), 0), dtype=np.float32)) + \
+            get_anchor_bounds(graph, anchors)
+    cliques = extend_cliques(graph, anchors[:, None], order, min_weight, bounds,
+                             chunk_size)
+    if np.any(order != np.arange(graph.k)):
+        #	restore picker order
+        cliques = cliques[:, np.argsort(order)]
+        cliques = cliques[np.lexsort(cliques.T[::-1])]
 
-    return vals
+    return cliques
 
 
-def main(args):
+def find_cliques_networkx(graph):
+    """returns cliques with one member per picker using networkx (slow, for debugging)"""
+    import networkx as nx
+
+    cliques = sorted([tuple(sorted(clique)) for clique in nx.find_cliques(graph.to_networkx())
+                      if len(clique) == graph.k])
+
+    return np.array(cliques, dtype=np.int64).reshape(-1, graph.k)
+
+
+def get_anchor_bounds(graph, anchors):
+    """returns the maximum neighbour confidence and Jaccard index of each anchor per picker"""
+    return (np.column_stack([graph.neighbour_max(anchors, p, graph.node_weights[graph.indices])
+                             for p in range(graph.k)]),
+            np.column_stack([graph.neighbour_max(anchors, p, graph.weights)
+                             for p in range(graph.k)]))
+
+
+def get_budget_weight(cliques, w, num_particles):
+    """returns the ILP weight of the num_particles-th clique of a greedy disjoint packing"""
+    if len(cliques) < num_particles:
+        return 0.
+    n, k = cliques.shape
+    A = csc_matrix((np.ones(n * k), cliques.ravel(), np.arange(0, n * k + 1, k)),
+                   shape=(np.max(cliques) + 1, n))
+    w = np.sort(w[greedy_packing(A, w) == 1.])[::-1]
+
+    return float(w[num_particles - 1]) if len(w) >= num_particles else 0.
+
+
+def get_candidate_pairs(coords_a, coords_b, box_size, block_size=2 ** 20):
+    """yields blocks of (i, j) index pairs of coords in neighbouring grid cells"""
+    if len(coords_a) == 0 or len(coords_b) == 0:
+        return
+    #	bin set B into a uniform grid (cell size = box size) - boxes can only
+    #		overlap if they are found in the same or neighbouring cells
+    cells_a = np.floor(coords_a / box_size).astype(np.int64)
+    cells_b = np.floor(coords_b / box_size).astype(np.int64)
+    #	offset cells so that neighbouring cell keys are non-negative
+    offset = np.min(np.vstack([cells_a, cells_b]), axis=0) - 1
+    cells_a -= offset
+    cells_b -= offset
+    n_rows = np.max(np.vstack([cells_a, cells_b])[:, 1]) + 2
+    keys_b = cells_b[:, 0] * n_rows + cells_b[:, 1]
+    order = np.argsort(keys_b, kind="stable")
+    keys, starts, counts = np.unique(
+        keys_b[order], return_index=True, return_counts=True)
+
+    #	find the range of sorted set B indices in each of the 9 neighbouring cells
+    keys_a = cells_a[:, 0] * n_rows + cells_a[:, 1]
+    neighbours = (keys_a[:, None] + np.array([dx * n_rows + dy
+                                              for dx in (-1, 0, 1) for dy in (-1, 0, 1)]))
+    idx = np.minimum(np.searchsorted(keys, neighbours), len(keys) - 1)
+    found = keys[idx] == neighbours
+    range_starts = np.where(found, starts[idx], 0)
+    range_counts = np.where(found, counts[idx], 0)
+
+    #	split set A into blocks with a bounded number of candidate pairs
+    totals = np.cumsum(np.sum(range_counts, axis=1))
+    prev = 0
+    while prev < len(coords_a):
+        base = totals[prev - 1] if prev > 0 else 0
+        bound = max(np.searchsorted(totals, base + block_size, side="right"),
+                    prev + 1)
+        block_starts = range_starts[prev:bound].ravel()
+        block_counts = range_counts[prev:bound].ravel()
+        #	expand [start, start + count) ranges into flat index arrays
+        i = np.repeat(np.repeat(np.arange(prev, bound), 9), block_counts)
+        pos = np.arange(np.sum(block_counts)) - \
+            np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+        j = order[np.repeat(block_starts, block_counts) + pos]
+        #	preserve the original (set A, set B) pair order
+        sort_idx = np.lexsort((j, i))
+        yield i[sort_idx], j[sort_idx]
+        prev = bound
+
+
+def get_jaccard(set_a, set_b, box_size, threshold, block_size=2 ** 20):
+    """returns the Jaccard indices > 0 b/w two sets as (i, j, jaccard) arrays"""
+    coords_a = np.asarray(set_a, dtype=np.float64)[:, :2]
+    coords_b = np.asarray(set_b, dtype=np.float64)[:, :2]
+    rows, cols, vals = [], [], []
+    for i, j in get_candidate_pairs(coords_a, coords_b, box_size, block_size):
+        jaccard = calc_jaccard(coords_a, coords_b, i, j, box_size)
+        keep = (np.abs(coords_a[i, 0] - coords_b[j, 0]) <= box_size) & \
+            (jaccard > threshold)
+        rows.append(i[keep])
+        cols.append(j[keep])
+        vals.append(jaccard[keep])
+
+    return (np.concatenate(rows + [np.empty(0, dtype=np.int64)]),
+            np.concatenate(cols + [np.empty(0, dtype=np.int64)]),
+            np.concatenate(vals + [np.empty(0, dtype=np.float64)]))
+
+
+def get_weight_bound(graph, cliques, weights, max_confidences, max_jaccards):
+    """returns upper bounds of the ILP weights of cliques completed from partial cliques"""
+    n, q = cliques.shape
+    num_missing = graph.k * (graph.k - 1) // 2 - \
+        weights.shape[1] - max_jaccards.shape[1]
+    confidences = np.hstack([graph.node_weights[cliques], max_confidences])
+    weights = np.hstack([weights, max_jaccards,
+                         np.full((n, num_missing), np.max(graph.weights, initial=0.))])
+
+    return np.median(confidences, axis=1) * np.median(weights, axis=1)
+
+
+def get_clique_weights(graph, cliques):
+    """returns the ILP weights, confidences, and member Jaccard indices of (n, k) array of cliques"""
+    pairs = np.array(list(itertools.combinations(range(cliques.shape[1]), 2)),
+                     dtype=np.int64).reshape(-1, 2)
+    edge_weights = graph.edge_weights(
+        cliques[:, pairs[:, 0]], cliques[:, pairs[:, 1]])
+
+    #	calculate ILP weight for clique
+    #	median(Jaccard of members/edges) * median(members/nodes confidence)
+    confidence = np.median(
+        graph.node_weights[cliques], axis=1).astype(np.float32)
+    w = (confidence * np.median(edge_weights, axis=1)).astype(np.float32)
+
+    return w, confidence, edge_weights
+
+
+def get_ilp_structures(graph, cliques):
+    """returns ILP weight vector, confidences, best members, and constraint matrix of cliques"""
+    n, k = cliques.shape
+    pairs = list(itertools.combinations(range(k), 2))
+    w, confidence, edge_weights = get_clique_weights(graph, cliques)
+
+    #	determine best particle identification in clique based on overlap with
+    #		other members (weighted degree)
+    degree = np.zeros((n, k))
+    for j, (a, b) in enumerate(pairs):
+        degree[:, a] += edge_weights[:, j]
+        degree[:, b] += edge_weights[:, j]
+    best = cliques[np.arange(n), np.argmax(degree, axis=1)]
+
+    #	build (vertices x cliques) constraint matrix in CSC format - column j holds
+    #		the rows of clique j members in picker order
+    v = np.unique(cliques)
+    rows = np.searchsorted(v, cliques).ravel()
+    A = csc_matrix((np.ones(n * k, dtype=np.int64), rows, np.arange(0, n * k + 1, k)),
+                   shape=(len(v), n))
+
+    return w, confidence, best, A
+
+
+def get_file_hash(in_file):
+    """returns SHA-256 hash of file contents"""
+    with open(in_file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_manifest_entry(box_files, args):
+    """returns incremental mode manifest entry (input file hashes and parameters) of a micrograph"""
+    return {"inputs": {os.path.relpath(val, args.in_dir): get_file_hash(val)
+                       for val in sorted([val for val in box_files if val is not None])},
+            "params": {"box_size": args.box_size, "threshold": threshold,
+                       "multi_out": args.multi_out, "get_cc": args.get_cc,
+                       "min_weight": args.min_weight, "prune_cliques": args.prune_cliques,
+                       "version": CONSENSUS_VERSION}}
+
+
+def get_micrograph_size(box_files):
+    """returns the total size (in bytes) of a micrograph's BOX files across methods"""
+    return sum([os.path.getsize(val) for val in box_files if val is not None])
+
+
+def normalize_key(stem, method):
+    """returns micrograph key of a BOX file name (lowercase, without picker name suffix)"""
+    key = stem.lower()
+    for sep in "_-.":
+        if key.endswith(sep + method.lower()):
+            return key[:-len(sep + method)]
+
+    return key
+
+
+def pair_box_files(files, names, methods, start_method):
+    """returns BOX files paired with those of the start method and ambiguous methods"""
+    #	normalized names of the start method -> file names (micrograph basenames)
+    keys = {}
+    for stem, name in names[start_method].items():
+        keys.setdefault(name, []).append(stem)
+    lengths = sorted(set([len(key) for key in keys]))
+    index = {stem: [None] * len(methods) for stem in sorted(files[start_method])}
+    ambiguous = {}
+    for i, method in enumerate(methods):
+        if method == start_method:
+            for stem, val in files[method].items():
+                index[stem][i] = val
+            continue
+        #	a file is paired if its normalized name contains the key - find all
+        #		key-sized substrings of each normalized file name in the key dictionary
+        matches = {}
+        for stem, name in names[method].items():
+            for length in lengths:
+                for j in range(0, len(name) - length + 1, 1):
+                    if name[j:j + length] in keys:
+                        matches.setdefault(name[j:j + length], {}).setdefault(
+                            name, []).append(stem)
+        for key, stems in matches.items():
+            if key in stems:
+                #	exact key matches are preferred
+                stems = stems[key]
+            elif len(stems) == 1:
+                stems = stems.popitem()[1]
+            else:
+                stems = []
+            for val in keys[key]:
+                if len(stems) == 1 and len(keys[key]) == 1:
+                    index[val][i] = files[method][stems[0]]
+                else:
+                    ambiguous.setdefault(val, []).append(method)
+    for key in ambiguous:
+        index[key] = [None] * len(methods)
+
+    return index, ambiguous
+
+
+def get_pairing_index(in_dir):
+    """returns method subdirectory names and an index of paired BOX files across methods"""
+    #	one directory scan per method - BOX file keys are file names without extension
+    methods = sorted([entry.name for entry in os.scandir(in_dir) if entry.is_dir()],
+                     key=str)
+    files = {method: {entry.name[:-len(".box")]: entry.path
+                      for entry in os.scandir(os.path.join(in_dir, method))
+                      if entry.name.endswith(".box") and entry.is_file()}
+             for method in methods}
+    names = {method: {stem: normalize_key(stem, method) for stem in files[method]}
+             for method in methods}
+
+    #	use the method whose naming convention pairs the most files across methods
+    #		(e.g., the shortest naming convention)
+    best = None
+    for method in methods:
+        index, ambiguous = pair_box_files(files, names, methods, method)
+        n = sum([all([val is not None for val in vals])
+                 for vals in index.values()])
+        if (best is None) or (n > best[0]):
+            best = (n, method, index, ambiguous)
+    assert(not best is None and best[0] >
+           0), "Error - particle file names cannot be paired across methods"
+    n, start_method, index, ambiguous = best
+    del best
+
+    print(f"Using {start_method} BOX files as starting point")
+    print(f"\t{n} of {len(index)} micrographs paired across {len(methods)} methods")
+    missing = [key for key, vals in index.items()
+               if any([val is None for val in vals]) and not key in ambiguous]
+    if len(missing) > 0:
+        print(f"\t{len(missing)} micrographs not picked by all methods")
+    if len(ambiguous) > 0:
+        print(
+            f"\t{len(ambiguous)} micrographs with ambiguous BOX file names (skipped):")
+        for key in sorted(ambiguous)[:10]:
+            print(f"\t\t{key}:", ', '.join(ambiguous[key]))
+        if len(ambiguous) > 10:
+            print(f"\t\t... ({len(ambiguous) - 10} more)")
+
+    return methods, index
+
+
+def remove_outputs(out_dir, basename):
+    """removes the output files of a micrograph"""
+    for suffix in out_suffixes:
+        out_file = os.path.join(out_dir, ''.join([basename, suffix]))
+        if os.path.exists(out_file):
+            os.remove(out_file)
+
+
+def get_tiles(coords, box_size, tile_size):
+    """yields node indices (per picker) and core masks of each spatial tile"""
+    keys = [np.floor(val / tile_size).astype(np.int64) for val in coords]
+    for tile in np.unique(np.vstack(keys), axis=0):
+        lower, upper = tile * tile_size - box_size, (tile + 1) * tile_size + box_size
+        idx = [np.where(np.all((val >= lower) & (val <= upper), axis=1))[0]
+               for val in coords]
+        cores = [np.all(key[val] == tile, axis=1) for key, val in zip(keys, idx)]
+
+        yield idx, cores
+
+
+def process_tile(coords, weights, cores, box_size, min_weight=None):
+    """returns the Jaccard edges and cliques of a spatial tile"""
+    pairs = list(itertools.combinations(list(range(len(coords))), 2))
+    jaccards = [get_jaccard(coords[j], coords[k], box_size, threshold)
+                for (j, k) in pairs]
+    graph = ConsensusGraph([len(val) for val in coords], jaccards,
+                           node_weights=np.concatenate(weights))
+    #	all members of a clique overlap its picker 0 member, so cliques anchored in the
+    #		core are complete within the halo
+    cliques = find_cliques(graph, min_weight=min_weight)
+    cliques = cliques[cores[0][cliques[:, 0]]]
+    jaccards = [tuple([val[cores[j][i]] for val in (i, k, jaccard)])
+                for (j, _), (i, k, jaccard) in zip(pairs, jaccards)]
+
+    return jaccards, cliques
+
+
+def get_tiled_cliques(coords, weights, box_size, tile_size, jobs=1, min_weight=None):
+    """returns the Jaccard edges and cliques of a micrograph found per spatial tile"""
+    k = len(coords)
+    pairs = list(itertools.combinations(list(range(k)), 2))
+    offsets = np.concatenate([[0], np.cumsum([len(val) for val in coords])])
+    tiles = list(get_tiles(coords, box_size, tile_size))
+    print("\tNumber of tiles:", len(tiles))
+    tile_args = [([val[i] for val, i in zip(coords, idx)], [val[i] for val, i in zip(weights, idx)],
+                  cores, box_size, min_weight) for idx, cores in tiles]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(process_tile, *zip(*tile_args)))
+    else:
+        results = [process_tile(*val) for val in tile_args]
+    del tile_args
+
+    #	map tile node indices to micrograph node indices - every edge and clique is
+    #		anchored in exactly one tile core, so merged results hold no duplicates
+    edges, cliques = [[] for _ in pairs], [np.empty((0, k), dtype=np.int64)]
+    for (idx, _), (tile_edges, tile_cliques) in zip(tiles, results):
+        for n, ((j, l), (a, b, val)) in enumerate(zip(pairs, tile_edges)):
+            edges[n].append((idx[j][a], idx[l][b], val))
+        tile_offsets = np.concatenate([[0], np.cumsum([len(val) for val in idx])])
+        cliques.append(np.column_stack([offsets[j] + idx[j][tile_cliques[:, j] - tile_offsets[j]]
+                                        for j in range(k)]).reshape(-1, k))
+    jaccards = []
+    for vals in edges:
+        i, j, val = [np.concatenate([val[n] for val in vals]) for n in range(3)]
+        #	sort edges and cliques in the order of the untiled search
+        order = np.lexsort((j, i))
+        jaccards.append((i[order], j[order], val[order]))
+
+    return jaccards, np.unique(np.vstack(cliques), axis=0)
+
+
+def get_consensus_data(box_files, methods, box_size, multi_out=False, get_cc=False,
+                       networkx=False, tile_size=None, tile_jobs=1, min_weight=None,
+                       num_particles=None, metrics=None):
+    """returns ILP data structures and connected component sizes of a micrograph"""
+    metrics = {} if metrics is None else metrics
+    stages = metrics.setdefault("stages", {})
+    start = time.time()
+    #	assign box IDs per micrograph so that output does not depend on processing order
+    context = MicrographContext()
+    if any([val is None for val in box_files]):
+        return None, None
+
+    print("Loading particle coordinates into memory ... ")
+    #	get detections for each provided picker - box IDs are unique across pickers
+    boxes = []
+    for box_file in box_files:
+        boxes.append(context.read_box_file(box_file))
+    metrics["num_nodes"] = [len(val) for val in boxes]
+    if any([len(val) == 0 for val in boxes]):
+        return None, None
+    coords = [np.column_stack((val["x"], val["y"])) for val in boxes]
+    start = add_stage_time(stages, "parse", start)
+
+    print("Calculating Jaccard indices ... ")
+    if tile_size is None:
+        #	calculate Jaccard indices between pairs
+        jaccards = [get_jaccard(coords[j], coords[k], box_size, threshold)
+                    for (j, k) in itertools.combinations(list(range(len(coords))), 2)]
+    else:
+        #	calculate Jaccard indices and find cliques per spatial tile
+        jaccards, all_cliques = get_tiled_cliques(coords, [val["conf"] for val in boxes],
+                                                  box_size, tile_size, jobs=tile_jobs,
+                                                  min_weight=min_weight)
+    #	tiled runs include clique enumeration in the edge stage
+    start = add_stage_time(stages, "edges", start)
+
+    print("Building graph ... ")
+    #	build compact graph of weighted pairs - node IDs are ordered by picker
+    node_coords = np.concatenate(coords)
+    node_ids = np.concatenate([val["id"] for val in boxes])
+    graph = ConsensusGraph([len(val) for val in boxes], jaccards,
+                           node_weights=np.concatenate([val["conf"] for val in boxes]))
+
+    #	list connected component stats
+    components = graph.component_sizes()
+    print("\tNumber of CCs:", len(components))
+    #	micrographs without overlapping picks have no CCs
+    largest = int(np.max(components, initial=0))
+    print("\tlargest CC length:", largest)
+    print("\tmean CC length:", np.mean(components) if len(components) > 0 else 0.)
+    sizes, counts = np.unique(components, return_counts=True)
+    metrics.update({"num_edges": int(graph.num_edges),
+                    "components": {"number": len(components), "largest": largest,
+                                   "histogram": {str(key): int(val) for key, val in zip(sizes, counts)}}})
+    start = add_stage_time(stages, "graph", start)
+
+    print("Finding cliques ... ")
+    #	find cliques
+    clique_size = len(coords)
+    if networkx:
+        all_cliques = find_cliques_networkx(graph)
+    elif tile_size is None and not num_particles is None:
+        all_cliques = find_budget_cliques(graph, num_particles, min_weight=min_weight)
+    elif tile_size is None:
+        all_cliques = find_cliques(graph, min_weight=min_weight)
+    if not min_weight is None:
+        #	filter cliques by their exact ILP weight
+        all_cliques = all_cliques[get_clique_weights(
+            graph, all_cliques)[0] >= min_weight]
+    if not num_particles is None:
+        #	filter cliques that cannot reach the weight of the num_particles-th best clique
+        w = get_clique_weights(graph, all_cliques)[0]
+        budget_weight = get_budget_weight(all_cliques, w, num_particles)
+        all_cliques = all_cliques[w >= budget_weight]
+        print("\tBudget weight:", budget_weight)
+        metrics["budget_weight"] = budget_weight
+        del w
+    if get_cc:
+        #	filter cliques for those in the largest CC - cliques are connected,
+        #		so checking a single member is sufficient
+        all_cliques = all_cliques[graph.largest_component()[
+            all_cliques[:, 0]]]
+    print('\t', len(all_cliques), "cliques found with", len(
+        np.unique(all_cliques)), "unique vertices")
+    metrics.update({"num_cliques": len(all_cliques),
+                    "num_vertices": len(np.unique(all_cliques))})
+    start = add_stage_time(stages, "cliques", start)
+
+    print("Building ILP data structures ... ")
+    w, confidence, best, A = get_ilp_structures(graph, all_cliques)
+    data = {"w": w, "confidences": confidence, "A": A, "multi_out": multi_out,
+            "labels": None, "extra_coords": None, "extra_ids": None}
+    if multi_out:
+        #	return all nodes in clique sorted by picker name
+        extra = np.empty(0, dtype=np.int64)
+        if not get_cc:
+            #	add vertices not found in any clique
+            in_clique = np.zeros(graph.num_nodes, dtype=bool)
+            in_clique[all_cliques.ravel()] = True
+            extra = np.where(~in_clique)[0]
+        extra_coords = np.full((len(extra), clique_size, 2), np.nan)
+        extra_ids = np.full((len(extra), clique_size), -1, dtype=np.int64)
+        extra_coords[np.arange(len(extra)), graph.labels[extra]
+                     ] = node_coords[extra]
+        extra_ids[np.arange(len(extra)), graph.labels[extra]
+                  ] = node_ids[extra]
+        data.update({"coords": node_coords[all_cliques], "ids": node_ids[all_cliques],
+                     "labels": list(methods), "extra_coords": extra_coords,
+                     "extra_ids": extra_ids})
+    else:
+        data.update({"coords": node_coords[best], "ids": node_ids[best]})
+    add_stage_time(stages, "ilp_structures", start)
+
+    return data, components
+
+
+def find_micrograph_cliques(basename, box_files, methods, args, command, num_particles=None,
+                            networkx=False):
+    """returns ILP data structures (None if skipped), CC sizes, metrics, and start time of a micrograph"""
+    start = time.time()
+    print(f"\n--- {basename} ---\n")
+
+    metrics = {}
+    data, components = get_consensus_data(box_files, methods, args.box_size,
+                                          multi_out=args.multi_out, get_cc=args.get_cc,
+                                          networkx=networkx, tile_size=args.tile_size,
+                                          tile_jobs=args.tile_jobs, min_weight=args.min_weight,
+                                          num_particles=num_particles, metrics=metrics)
+    if data is None:
+        #	create empty BOX file if particles are not picked by all methods
+        print("Skipping micrograph - not all methods have picked particles...")
+        out_file = os.path.join(args.out_dir, ''.join([basename, ".box"]))
+        with open(out_file, 'wt') as o:
+            pass
+        write_metrics(os.path.join(args.out_dir, ''.join([basename, "_metrics.json"])),
+                      command, metrics, start, skipped=True)
+
+    return data, components, metrics, start
+
+
+def process_micrograph(basename, box_files, methods, args):
+    """finds the cliques of a single micrograph and writes ILP data structures to storage"""
+    data, components, metrics, start = find_micrograph_cliques(
+        basename, box_files, methods, args, name, args.prune_cliques, args.networkx)
+    if data is None:
+        return
+
+    #	write structures to storage for ILP optimization
+    write_start = time.time()
+    write_ilp_data(os.path.join(args.out_dir, ''.join(
+        [basename, "_cliques.bin"])), data)
+    add_stage_time(metrics["stages"], "write_cliques", write_start)
+    write_metrics(os.path.join(args.out_dir, ''.join([basename, "_metrics.json"])),
+                  name, metrics, start)
+
+    out_file = os.path.join(args.out_dir, ''.join(
+        [basename, "_runtime.tsv"]))
+    with open(out_file, 'wt') as o:
+        #	runtime (in seconds), largest CC, number of CC
+        o.write('\t'.join([str(val) for val in [time.time() - start,
+                np.max(components, initial=0), len(components)]]) + '\n')
+
+
+def check_clique_arguments(args):
+    """checks the clique search arguments shared with the consensus command"""
     #	ensure input directory exists
     assert(os.path.exists(args.in_dir)), "Error - input directory does not exist"
+    assert(args.jobs > 0 and args.tile_jobs >
+           0), "Error - number of jobs must be a positive integer"
+    assert(args.tile_size is None or args.tile_size >
+           0), "Error - tile size must be a positive integer"
+
+
+def main(args):
+    check_clique_arguments(args)
+    assert(args.prune_cliques is None or args.prune_cliques >
+           0), "Error - number of particles must be a positive integer"
 
     #	set up output directory
-    del_dir(args.out_dir)
-    exclude = ["box_size", "out_dir", "multi_out", "get_cc"]
+    if not args.incremental:
+        del_dir(args.out_dir)
 
     #	get method subdirectories
-    methods = sorted([os.path.basename(val) for val in glob.glob(os.path.join(args.in_dir, '*'))
-                      if os.path.isdir(val)], key=str)
     create_dir(args.out_dir)
-
-    #	determine method with shortest naming convention
-    start_method = None
-    num_methods = len(methods)
-    for method in methods:
-        #	collect example box file from each method subdirectory
-        for box_file in glob.glob(os.path.join(args.in_dir, method, "*.box")):
-            #	identify basename of file and use it to find matching files in other subdirectories
-            tmp = os.path.basename(box_file).replace(".box", '')
-            tmp = f"*{tmp}*"
-            n = len(sum([glob.glob(os.path.join(args.in_dir, method, tmp))
-                    for method in methods], []))
-            break
-        #	if the current method's naming convention can be used to identify pairs, keep it
-        if n == num_methods:
-            start_method = method
-            break
-    assert(not start_method ==
-           None), "Error - particle file names cannot be paired across methods"
-    del box_file, tmp, n
-
-    print(f"Using {start_method} BOX files as starting point")
-
-    #	iterate over crYOLO files and parse matching DeepPicker & Topaz files
-    for i, box_file in enumerate(glob.glob(os.path.join(args.in_dir, methods[0], "*.box"))):
-
-        start = time.time()
-        #	dertemine basename of particle file
-        basename = os.path.basename(box_file).replace(".box", '')
-        print(f"\n--- {basename} ---\n")
-        basename = f"*{basename}*"
-
-        print("Loading particle coordinates into memory ... ")
-        try:
-            #	get coords for each provided picker
-            coords = [get_box_coords(box_file, return_weights=True)]
-            for method in methods[1:]:
-                coords.append(get_box_coords(os.path.join(args.in_dir, method, basename),
-                                             return_weights=True))
-        except (UnboundLocalError, IndexError) as e:
-            #	create empty BOX file if particles are not picked by all methods
-            print("Skipping micrograph - not all methods have picked particles...")
-            out_file = os.path.join(args.out_dir, ''.join(
-                [basename[1:-1], ".box"]))
-            with open(out_file, 'wt') as o:
-                pass
-            continue
-
-        print("Calculating Jaccard indices ... ")
-        #	calculate Jaccard indices between pairs
-        label_pairs, jaccards = [], []
-        for (j, k) in itertools.combinations(list(range(len(coords))), 2):
-            label_pairs.append((methods[j], methods[k]))
-            jaccards.append(get_jaccard(
-                coords[j], coords[k], args.box_size, 0.3))
-
-        print("Building graph ... ")
-        #	build graph weighted pairs
-        graph = nx.Graph()
-        [add_nodes_to_graph(graph, vals, methods) for vals in jaccards]
-
-        #	list connected component stats
-        components = [len(val) for val in nx.connected_components(graph)]
-        print("\tNumber of CCs:", len(components))
-        print("\tlargest CC length:", np.max(components))
-        print("\tmean CC length:", np.mean(components))
-
-        if args.get_cc:
-            #	replace graph of all particle detections with largest CC
-            for cc in sorted(nx.connected_components(graph), key=len, reverse=True):
-                # if len(cc) == 12:
-                graph = graph.subgraph(cc)
-                break
-
-        print("Finding cliques ... ")
-        #	find cliques
-        clique_size = len(coords)
-        all_cliques = find_cliques(graph, clique_size)
-        n = len(all_cliques)
-        # sorted list of vertices in cliques
-        v = sorted(set(sum(all_cliques, ())))
-        print('\t', n, "cliques found with", len(v), "unique vertices")
-
-        print("Building ILP data structures ... ")
-        # cliques confidences - median(clique confidences)
-        confidence = np.zeros(n, dtype=np.float32)
-        w = np.zeros(n, dtype=np.float32)  # weight vector of cliques
-        #	iterate over cliques, fill in w, retain vertex-to-clique assignments
-        cliques, rows, cols = [], [], []
-        for j, clique in enumerate(all_cliques):
-            subgraph = graph.subgraph(clique)
-            if args.multi_out:
-                #	return all nodes in clique sorted by picker name
-                cliques.append(sorted(subgraph.nodes(),
-                                      key=lambda x: subgraph.nodes[x]["name"]))
-            else:
-                #	determine best particle identification in clique based on
-                #		overlap with other members
-                cliques.append(max(subgraph.degree(weight="weight"),
-                                   key=lambda x: x[1])[0])
-            #	calculate ILP weight for clique
-            #	median(Jaccard of members/edges) * median(members/nodes confidence)
-            confidence[j] = np.median(
-                list(nx.get_node_attributes(subgraph, "weight").values()))
-            w[j] = confidence[j] * \
-                np.median(list(nx.get_edge_attributes(
-                    subgraph, "weight").values()))
-            #	retain row / col indices for sparse matrix
-            cols.extend([j] * clique_size)
-            rows.extend([v.index(val) for val in clique])
-        assert(len(cliques) == len(
-            w)), "Error - concensus coordinates and ILP weight vector are not equal lengths"
-        assert(len(w) == len(confidence)
-               ), "Error - cliques weights and confidences are not equal lengths"
-        assert(len(cols) == len(
-            rows)), "Error - ILP sparse matrix indices (rows / cols) are not equal lengths"
-        assert(len(cliques) * clique_size == len(cols)
-               ), "Error - consensus coordinates or ILP sparse matrix indices (rows / cols) missing"
-        A = coo_matrix(([1] * len(cols), (rows, cols)), shape=(len(v), n))
-        del n, v, rows, cols, j, clique, subgraph
-
-        #	write structures to storage for ILP optimization
-        if args.multi_out:
-            #	add header
-            cliques = [methods] + cliques
-            if not args.get_cc:
-                clique_set = set([val for clique in cliques for val in clique])
-                for j in range(0, clique_size, 1):
-                    cliques.extend([get_box_vertex_entry(val, clique_size, j)
-                                    for val in set(coords[j]).difference(clique_set)])
-
-        for label, val in zip(
-                ["weight_vector", "consensus_coords",
-                    "consensus_confidences", "constraint_matrix"],
-                [w, cliques, confidence, A]):
-            out_file = os.path.join(args.out_dir, ''.join(
-                [basename[1:-1], '_', label, ".pickle"]))
-            with open(out_file, 'wb') as o:
-                pickle.dump(val, o, protocol=pickle.HIGHEST_PROTOCOL)
-
-        out_file = os.path.join(args.out_dir, ''.join(
-            [basename[1:-1], "_runtime.tsv"]))
-        with open(out_file, 'wt') as o:
-            #	runtime (in seconds), largest CC, number of CC
-            o.write('\t'.join([str(val) for val in [time.time() - start,
-                    np.max(components), len(components)]]) + '\n')
+    methods, index = get_pairing_index(args.in_dir)
+
+    #	iterate over paired BOX files of each micrograph
+    basenames = list(index)
+    manifest = {}
+    if args.incremental:
+        #	skip micrographs whose BOX files and parameters have not changed since the last run
+        manifest_file = os.path.join(args.out_dir, "manifest.json")
+        prev_manifest = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'rt') as f:
+                prev_manifest = json.load(f)
+        todo = []
+        for basename in basenames:
+            manifest[basename] = get_manifest_entry(index[basename], args)
+            if ((prev_manifest.get(basename) == manifest[basename]) and
+                    any([os.path.exists(os.path.join(args.out_dir, ''.join([basename, suffix])))
+                         for suffix in ["_cliques.bin", ".box"]])):
+                continue
+            remove_outputs(args.out_dir, basename)
+            todo.append(basename)
+        #	remove outputs of micrographs that no longer exist
+        for basename in set(prev_manifest).difference(manifest):
+            remove_outputs(args.out_dir, basename)
+        print(f"Incremental mode - processing {len(todo)} of {len(basenames)} micrographs",
+              f"({len(set(prev_manifest).difference(manifest))} stale micrographs removed)")
+        basenames = todo
+        del prev_manifest, todo
+
+    if args.jobs > 1:
+        #	largest micrographs (by BOX file size) first to keep workers busy
+        basenames = sorted(basenames, key=lambda val: get_micrograph_size(
+            index[val]), reverse=True)
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(process_micrograph, basename, index[basename], methods, args)
+                       for basename in basenames]
+            for future in futures:
+                future.result()
+    else:
+        for basename in basenames:
+            process_micrograph(basename, index[basename], methods, args)
+
+    if args.incremental:
+        #	write manifest after all micrographs have been processed
+        with open(manifest_file + ".tmp", 'wt') as o:
+            json.dump(manifest, o, indent=1, sort_keys=True)
+        os.replace(manifest_file + ".tmp", manifest_file)
 
 
 if __name__ == '__main__':
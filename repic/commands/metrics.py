@@ -0,0 +1,118 @@
+#!/usr/local/bin/python3
+#
+#	metrics.py - aggregate per-micrograph metrics files (*_metrics.json) of get_cliques,
+#		run_ilp, and consensus across a dataset
+#
+
+from repic.utils.common import *
+
+name = "metrics"
+#	pipeline stages in order of execution
+stages = ["parse", "edges", "graph", "cliques", "ilp_structures", "write_cliques",
+          "read_cliques", "ilp_build", "solve", "write_consensus"]
+columns = ["micrograph", "total"] + stages + ["num_nodes", "num_edges", "num_cliques",
+                                             "num_vertices", "budget_weight", "cc_number",
+                                             "cc_largest", "mip_ccs", "solver_nodes", "gap",
+                                             "solver_status", "proved_optimal", "solver_backends",
+                                             "solver_post_solve_memory_mb", "peak_rss_mb", "skipped"]
+
+
+def add_arguments(parser):
+    """adds parser arguments for script"""
+    parser.add_argument("in_dir",
+                        help="path to input directory containing get_cliques, run_ilp, or consensus output")
+    parser.add_argument("--out_file", type=str,
+                        help="path to output TSV file (default: <in_dir>/metrics.tsv)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest micrographs to report (default: 10)")
+
+
+def get_metrics_row(basename, record):
+    """returns flattened metrics of a micrograph summed over commands"""
+    row = {"micrograph": basename, "total": 0.,
+           "peak_rss_mb": 0., "skipped": False}
+    for command, metrics in sorted(record.items()):
+        row["total"] += metrics["total"]
+        row["peak_rss_mb"] = max(row["peak_rss_mb"], metrics["peak_rss_mb"])
+        row["skipped"] = row["skipped"] or metrics.get("skipped", False)
+        for stage, val in metrics.get("stages", {}).items():
+            row[stage] = row.get(stage, 0.) + val
+        for key in ["num_edges", "num_cliques", "num_vertices", "budget_weight"]:
+            if key in metrics:
+                row[key] = metrics[key]
+        if "num_nodes" in metrics:
+            row["num_nodes"] = sum(metrics["num_nodes"])
+        if "components" in metrics:
+            row["cc_number"] = metrics["components"]["number"]
+            row["cc_largest"] = metrics["components"]["largest"]
+        if "solver" in metrics:
+            row["mip_ccs"] = metrics["solver"]["mip"]
+            row["solver_nodes"] = metrics["solver"]["nodes"]
+            row["gap"] = metrics["solver"]["gap"]
+            row["proved_optimal"] = metrics["solver"].get("proved_optimal", True)
+            row["solver_post_solve_memory_mb"] = metrics["solver"].get(
+                "post_solve_memory_mb", 0.)
+            row["solver_status"] = ','.join([f"{key}:{val}" for key, val
+                                             in sorted(metrics["solver"]["status"].items())])
+            row["solver_backends"] = ','.join([f"{key}:{val}" for key, val
+                                               in sorted(metrics["solver"].get("backends", {}).items())])
+
+    return row
+
+
+def main(args):
+
+    assert(os.path.isdir(args.in_dir)), "Error - input directory is missing"
+    in_files = sorted(glob.glob(os.path.join(args.in_dir, "*_metrics.json")))
+    assert(len(in_files) > 0), "Error - no metrics files (*_metrics.json) found"
+
+    #	flatten metrics records of each micrograph
+    rows, histogram = [], {}
+    for in_file in in_files:
+        with open(in_file, 'rt') as f:
+            record = json.load(f)
+        rows.append(get_metrics_row(os.path.basename(
+            in_file)[:-len("_metrics.json")], record))
+        for metrics in record.values():
+            for key, val in metrics.get("components", {}).get("histogram", {}).items():
+                histogram[int(key)] = histogram.get(int(key), 0) + val
+    #	sort micrographs by total runtime (descending)
+    rows = sorted(rows, key=lambda val: -val["total"])
+
+    out_file = args.out_file if args.out_file else os.path.join(
+        args.in_dir, "metrics.tsv")
+    with open(out_file, 'wt') as o:
+        o.write('\t'.join(columns) + '\n')
+        for row in rows:
+            o.write('\t'.join([str(row[key]) if key in row else "N/A"
+                               for key in columns]) + '\n')
+
+    print(f"{len(rows)} micrographs ({sum([row['skipped'] for row in rows])} skipped)")
+    print(f"Total runtime: {sum([row['total'] for row in rows]):.2f} s")
+    print(f"Peak RSS: {max([row['peak_rss_mb'] for row in rows]):.1f} MB")
+    non_optimal = [row for row in rows if not row.get("proved_optimal", True)]
+    if len(non_optimal) > 0:
+        print(f"{len(non_optimal)} micrographs did not prove optimality (max gap:",
+              f"{np.max([row['gap'] for row in non_optimal], initial=0.):.2e})")
+    print("Stage runtimes (in seconds) - total, mean, max:")
+    for stage in stages:
+        vals = [row[stage] for row in rows if stage in row]
+        if len(vals) > 0:
+            print(f"\t{stage}: {np.sum(vals):.3f}, {np.mean(vals):.3f}, {np.max(vals):.3f}")
+    if len(histogram) > 0:
+        print("CC size histogram (size: count):")
+        print('\t' + ', '.join([f"{key}: {histogram[key]}"
+                                for key in sorted(histogram)]))
+    print(f"Slowest {min(args.top, len(rows))} micrographs:")
+    for row in rows[:args.top]:
+        slowest = max([val for val in stages if val in row],
+                      key=lambda val: row[val], default="N/A")
+        print(f"\t{row['micrograph']}: {row['total']:.3f} s (slowest stage: {slowest})")
+    print("Metrics written to:", out_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
@@ -1,13 +1,15 @@
 #!/usr/local/bin/python3
 #
-#	run_ilp.py -  run Gurobi ILP optimizer to identify best particle cliques
+#	run_ilp.py -  run ILP optimizer (Gurobi or HiGHS) to identify best particle cliques
 #	author: Christopher JF Cameron
 #
 
-import gurobipy as gp
-
+from concurrent.futures import ProcessPoolExecutor
 from repic.utils.common import *
-from gurobipy import GRB
+from repic.utils.solvers import SolverPool, backends, get_gap, get_matching_pairs, get_solve_threads, \
+    gurobi_available, solve_mip, solve_relaxation
+from scipy.sparse import block_diag, bmat
+from scipy.sparse.csgraph import connected_components
 
 name = "run_ilp"
 
@@ -20,120 +22,415 @@ def add_arguments(parser):
                         help="particle detection box size (in int[pixels])")
     parser.add_argument("--num_particles", type=int,
                         help="filter for the number of expected particles (int)")
+    parser.add_argument("--cc_jobs", type=int, default=1,
+                        help="number of connected components of cliques to solve in parallel (default: 1)")
+    parser.add_argument("--solver", type=str, choices=backends, default="auto",
+                        help="ILP solver backend - auto uses Gurobi if available and HiGHS otherwise (default: auto)")
+    parser.add_argument("--relaxation_gap", type=float,
+                        help="try LP relaxation and greedy packing before the ILP solver and accept solutions within given relative gap of the LP bound (float)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of micrographs (or batches) to solve in parallel (default: 1)")
+    parser.add_argument("--threads_per_solve", "--threads-per-solve", type=int, dest="threads_per_solve",
+                        help="number of Gurobi threads per solve - capped so that concurrent solves share the available cores (default: cores / (jobs x cc_jobs))")
+    parser.add_argument("--time_limit", type=float,
+                        help="ILP solver time limit per micrograph (in seconds) - the best solution found is written when reached (float)")
+    parser.add_argument("--mip_gap", type=float,
+                        help="relative MIP gap at which the ILP solver stops (float)")
+    parser.add_argument("--batch_size", type=int,
+                        help="solve connected components of cliques (across micrographs) in block-diagonal models of up to given number of cliques (int)")
+
+
+def get_ilp_size(in_file):
+    """returns the number of non-zero entries and cliques of a get_cliques output file"""
+    A = read_ilp_data(in_file)["A"]
+
+    return A.nnz, A.shape[1]
+
+
+def get_ilp_files(in_dir):
+    """returns get_cliques output files of an input directory"""
+    in_files = glob.glob(os.path.join(in_dir, "*_cliques.bin"))
+    basenames = set([get_ilp_basename(val) for val in in_files])
+    in_files.extend([val for val in glob.glob(os.path.join(in_dir, "*_constraint_matrix.pickle"))
+                     if not get_ilp_basename(val) in basenames])
+
+    return sorted(in_files)
+
+
+def get_ilp_basename(in_file):
+    """returns micrograph basename of get_cliques output file"""
+    for suffix in ["_cliques.bin", "_constraint_matrix.pickle"]:
+        if in_file.endswith(suffix):
+            return os.path.basename(in_file[:-len(suffix)])
+
+    return os.path.basename(in_file)
+
+
+def write_summary(out_file, summaries):
+    """writes the solver summaries of micrographs that did not prove optimality to a TSV file"""
+    rows = sorted([(basename, summary) for basename, summary in summaries
+                   if not summary["proved_optimal"]],
+                  key=lambda val: -np.nan_to_num(val[1]["gap"], nan=np.inf))
+    with open(out_file, 'wt') as o:
+        o.write('\t'.join(["micrograph", "status", "gap", "objective", "bound"]) + '\n')
+        for basename, summary in rows:
+            o.write('\t'.join([basename, get_solver_status(summary)] + [str(summary[key])
+                               for key in ["gap", "objective", "bound"]]) + '\n')
+    print(f"{len(rows)} of {len(summaries)} micrographs did not prove optimality",
+          f"(max gap: {np.max([val[1]['gap'] for val in rows], initial=0.):.2e}) - see {out_file}")
+
+
+def write_multi_out(out_file, data, chosen):
+    """writes chosen cliques (all members) and vertices not in chosen cliques to TSV file"""
+    coords, ids, labels = data["coords"], data["ids"], data["labels"]
+    n = len(labels)
+    rows = [(coords[i], data["confidences"][i]) for i in chosen]
+    #	retain vertices not found in chosen cliques
+    extra_coords = data["extra_coords"] if data["extra_coords"] is not None \
+        else np.empty((0, n, 2))
+    extra_ids = data["extra_ids"] if data["extra_ids"] is not None \
+        else np.empty((0, n), dtype=np.int64)
+    for i in range(0, n, 1):
+        vertex_ids = np.concatenate([ids[:, i], extra_ids[:, i]])
+        vertex_coords = np.concatenate([coords[:, i], extra_coords[:, i]])
+        keep = (vertex_ids >= 0) & ~np.isin(vertex_ids, ids[chosen, i])
+        _, idx = np.unique(vertex_ids[keep], return_index=True)
+        for val in vertex_coords[keep][idx]:
+            entry = np.full((n, 2), np.nan)
+            entry[i] = val
+            rows.append((entry, 0.))
+
+    with open(out_file, 'wt') as o:
+        o.write('\t'.join(labels) + '\n')
+        o.write('\n'.join(['\t'.join(['\t'.join([
+                str(int(np.rint(val[0]))), str(int(np.rint(val[1])))])
+            if not np.isnan(val[0]) else "N/A\tN/A" for val in vals] + [str(weight)])
+            for (vals, weight) in rows]))
+
+
+def get_components(A):
+    """returns the number of connected components (CCs) of cliques and the CC label of each clique"""
+    incidence = bmat([[None, A], [A.T, None]], format="csr")
+    _, labels = connected_components(incidence, directed=False)
+    #	relabel CCs of cliques (every vertex belongs to a clique)
+    _, labels = np.unique(labels[A.shape[0]:], return_inverse=True)
+
+    return np.max(labels, initial=-1) + 1, labels
+
+
+def get_batches(subproblems, batch_size):
+    """returns lists of subproblem indices packed into batches of at most batch_size cliques"""
+    batches, size = [], 0
+    for i, (_, _, w) in enumerate(subproblems):
+        if len(batches) == 0 or size + len(w) > batch_size:
+            batches.append([])
+            size = 0
+        batches[-1].append(i)
+        size += len(w)
+
+    return batches
+
+
+def get_solver_status(summary):
+    """returns the status of a micrograph solve"""
+    if summary["proved_optimal"]:
+        return "optimal"
+
+    return ','.join(sorted([key for key in summary["status"] if key != "optimal"]))
+
+
+def get_subproblems(A, w):
+    """returns the closed form solution, non-trivial CC subproblems, and number of CCs"""
+    A, w = A.tocsc(), np.asarray(w)
+    n, labels = get_components(A)
+    sizes = np.bincount(labels, minlength=n)
+    x = np.zeros(A.shape[1])
+
+    #	trivial CCs are resolved in closed form: a single clique is chosen if it has a
+    #		positive weight and of two (conflicting) cliques the heavier one is chosen
+    single = sizes[labels] == 1
+    x[single] = w[single] > 0
+    order = np.argsort(labels, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    for label in np.where(sizes == 2)[0]:
+        idx = order[bounds[label]:bounds[label + 1]]
+        if np.max(w[idx]) > 0:
+            x[idx[np.argmax(w[idx])]] = 1
+
+    #	non-trivial CCs are passed to the ILP solver
+    subproblems = []
+    for label in np.where(sizes > 2)[0]:
+        idx = order[bounds[label]:bounds[label + 1]]
+        sub_A = A[:, idx]
+        sub_A = sub_A[np.unique(sub_A.indices)]
+        subproblems.append((idx, sub_A, w[idx]))
+    print(f"\t{n} CCs of cliques - {np.sum(sizes <= 2)} resolved in closed form,",
+          f"{len(subproblems)} passed to ILP solver")
+
+    return x, subproblems, int(n)
+
+
+def solve_batch(subproblems, pool=None, solver="auto", threads=0, time_limit=None, mip_gap=None):
+    """returns solutions and solver statistics of subproblems solved as a block-diagonal model"""
+    if len(subproblems) == 1:
+        return [solve_mip(subproblems[0][1], subproblems[0][2], solver, threads=threads,
+                          time_limit=time_limit, mip_gap=mip_gap, pool=pool)]
+    w = np.concatenate([val[2] for val in subproblems])
+    x, stats = solve_mip(block_diag([val[1] for val in subproblems], format="csc"),
+                         w, solver, threads=threads, time_limit=time_limit, mip_gap=mip_gap,
+                         pool=pool)
+    slack = max(stats["bound"] - np.dot(w, x), 0.)
+    bounds = np.cumsum([0] + [len(val[2]) for val in subproblems])
+    results = []
+    for i, (_, _, sub_w) in enumerate(subproblems):
+        share = len(sub_w) / len(w)
+        sub_x = x[bounds[i]:bounds[i + 1]]
+        results.append((sub_x, dict(stats, build=stats["build"] * share,
+                                    solve=stats["solve"] * share, nodes=stats["nodes"] * share,
+                                    bound=np.dot(sub_w, sub_x) + slack * share)))
+
+    return results
+
+
+def solve_subproblems(subproblems, pool, solver="auto", relaxation_gap=None,
+                      batch_size=None, threads=0, time_limit=None, mip_gap=None):
+    """returns solutions and solver statistics of connected component subproblems"""
+    deadline = None if time_limit is None else time.time() + time_limit
+
+    def get_time_limit():
+        """returns the time left until the deadline"""
+        return None if deadline is None else deadline - time.time()
+
+    if batch_size is None:
+        return list(pool.map(lambda val: solve_mip(
+            val[1], val[2], solver, relaxation_gap, threads, get_time_limit(), mip_gap, pool),
+            subproblems))
+
+    results, todo, relaxation_time = [None] * len(subproblems), [], {}
+    for i, (_, sub_A, sub_w) in enumerate(subproblems):
+        if not relaxation_gap is None:
+            sub_x, stats = solve_relaxation(sub_A, sub_w, relaxation_gap,
+                                            get_time_limit())
+            if not sub_x is None:
+                results[i] = (sub_x, stats)
+                continue
+            relaxation_time[i] = stats["solve"]
+        todo.append(i)
+    batches = [[todo[i] for i in batch] for batch in get_batches(
+        [subproblems[i] for i in todo], batch_size)]
+    for batch, batch_results in zip(batches, pool.map(lambda val: solve_batch(
+            [subproblems[i] for i in val], pool, solver, threads, get_time_limit(), mip_gap),
+            batches)):
+        for i, (sub_x, stats) in zip(batch, batch_results):
+            #	time spent on rejected relaxations is part of the solve time
+            stats["solve"] += relaxation_time.get(i, 0.)
+            results[i] = (sub_x, stats)
+
+    return results
+
+
+def merge_solutions(A, w, x, subproblems, n, results, metrics):
+    """returns clique selection vector x merged from the closed form and subproblem solutions"""
+    stages = metrics.setdefault("stages", {})
+    A, w = A.tocsc(), np.asarray(w)
+    closed_form = n - len(subproblems)
+    summary = {"components": n, "closed_form": closed_form, "mip": len(subproblems),
+               "status": {"optimal": closed_form}, "backends": {}, "nodes": 0., "gap": 0.,
+               "post_solve_memory_mb": 0.}
+    #	upper bound of the objective value - closed form solutions are optimal
+    bound = np.dot(w, x)
+    for (idx, _, _), (sub_x, stats) in zip(subproblems, results):
+        x[idx] = sub_x
+        #	model build and solve times are summed across CCs (and threads)
+        stages["ilp_build"] = stages.get("ilp_build", 0.) + stats["build"]
+        stages["solve"] = stages.get("solve", 0.) + stats["solve"]
+        summary["status"][stats["status"]] = summary["status"].get(
+            stats["status"], 0) + 1
+        summary["backends"][stats["backend"]] = summary["backends"].get(
+            stats["backend"], 0) + 1
+        summary["nodes"] += stats["nodes"]
+        #	largest solver memory in use after a solve (only reported by Gurobi)
+        summary["post_solve_memory_mb"] = max(summary["post_solve_memory_mb"],
+                                              stats.get("post_solve_memory_mb", 0.))
+        bound += stats["bound"]
+    #	relative gap of the micrograph objective value to its upper bound
+    summary.update({"objective": float(np.dot(w, x)), "bound": float(bound),
+                    "gap": get_gap(np.dot(w, x), bound),
+                    "proved_optimal": set(summary["status"]) == {"optimal"}})
+    if summary["backends"]:
+        print(f"\tObjective: {summary['objective']:.6f} (gap: {summary['gap']:.2e},",
+              ', '.join([f"{key}: {val}" for key, val in sorted(summary["backends"].items())]) + ')')
+    print(f"\tModel build time: {stages.get('ilp_build', 0.):.4f} s,",
+          f"largest post-solve memory: {summary['post_solve_memory_mb']:.2f} MB")
+    metrics["solver"] = summary
+
+    #	check that each vertex is only chosen once
+    assert(np.max(A @ x, initial=1) ==
+           1), "Error - vertices are assigned to multiple cliques"
+
+    return x
+
+
+def solve_ilp(A, w, pool=None, metrics=None, solver="auto", relaxation_gap=None,
+              batch_size=None, threads=0, time_limit=None, mip_gap=None):
+    """returns binary clique selection vector x maximizing w^T x subject to A x <= 1"""
+    if pool is None:
+        with SolverPool() as pool:
+            return solve_ilp(A, w, pool, metrics, solver, relaxation_gap, batch_size,
+                             threads, time_limit, mip_gap)
+    metrics = {} if metrics is None else metrics
+    start = time.time()
+    x, subproblems, n = get_subproblems(A, w)
+    add_stage_time(metrics.setdefault("stages", {}), "ilp_build", start)
+    if len(subproblems) > 0 and not get_matching_pairs(A) is None:
+        #	two-picker cliques are edges of a bipartite graph - all CCs are solved
+        #		exactly by a single matching (see repic.utils.solvers.solve_matching())
+        results = solve_batch(subproblems)
+    else:
+        results = solve_subproblems(subproblems, pool, solver, relaxation_gap,
+                                    batch_size, threads, time_limit, mip_gap)
+
+    return merge_solutions(A, w, x, subproblems, n, results, metrics)
+
+
+def write_consensus(out_prefix, data, x, box_size, num_particles=None):
+    """writes chosen cliques to BOX file (or TSV file for multi_out) and returns its path"""
+    #	filter coords and clique weights for chosen cliques
+    chosen = np.where(x == 1.)[0]
+
+    box_size = str(box_size)
+    out_file = ''.join([out_prefix, ".tsv" if data["multi_out"] else ".box"])
+    if data["multi_out"]:
+        write_multi_out(out_file, data, chosen)
+    else:
+        coords, confidences = data["coords"], data["confidences"]
+        #	sort chosen cliques by confidence (descending)
+        chosen = chosen[np.argsort(-confidences[chosen], kind="stable")]
+        with open(out_file, 'wt') as o:
+            for i, j in enumerate(chosen):
+                if (num_particles == None) or (i < num_particles):
+                    o.write('\t'.join([
+                            str(int(np.rint(coords[j][0]))),
+                            str(int(np.rint(coords[j][1]))),
+                            box_size,
+                            box_size,
+                            str(confidences[j])]) + '\n')
+
+    return out_file
+
+
+def process_micrographs(in_files, args, threads=0):
+    """finds and writes the consensus particles of micrographs and returns their solver summaries"""
+    with SolverPool(args.cc_jobs) as pool:
+        pending, num_cliques, summaries = [], 0, []
+        for i, in_file in enumerate(in_files):
+
+            start = time.time()
+            basename = get_ilp_basename(in_file)
+            print(f"\n--- {basename} ---\n")
+
+            #	load constraint matrix and weight vector
+            metrics = {"stages": {}}
+            data = read_ilp_data(in_file)
+            stage_start = add_stage_time(metrics["stages"], "read_cliques", start)
+            problem = get_subproblems(data["A"], data["w"])
+            add_stage_time(metrics["stages"], "ilp_build", stage_start)
+            pending.append((basename, data, problem, metrics, start))
+            num_cliques += sum([len(val[2]) for val in problem[1]])
+            if (args.batch_size is not None) and (num_cliques < args.batch_size) and \
+                    (i < len(in_files) - 1):
+                continue
+
+            subproblems = [val for item in pending for val in item[2][1]]
+            if len(pending) > 1:
+                print(f"\nSolving {len(subproblems)} subproblems of {len(pending)} micrographs",
+                      f"({num_cliques} cliques) ... ")
+            #	batched micrographs share their time limits
+            results = solve_subproblems(subproblems, pool, args.solver,
+                                        args.relaxation_gap, args.batch_size, threads,
+                                        None if args.time_limit is None else args.time_limit * len(pending),
+                                        args.mip_gap)
+            for basename, data, (x, subproblems, n), metrics, start in pending:
+                if len(pending) > 1:
+                    print(f"{basename}:")
+                x = merge_solutions(data["A"], data["w"], x, subproblems, n,
+                                    results[:len(subproblems)], metrics)
+                metrics["solver"]["batch_micrographs"] = len(pending)
+                results = results[len(subproblems):]
+                write_outputs(args.in_dir, basename, data, x, metrics, start, args)
+                summaries.append((basename, metrics["solver"]))
+            pending, num_cliques = [], 0
+
+    return summaries
+
+
+def write_outputs(out_dir, basename, data, x, metrics, start, args, command=name,
+                  components=None):
+    """writes consensus particles, metrics, and runtime of a micrograph"""
+    stage_start = time.time()
+    write_consensus(os.path.join(out_dir, basename), data, x,
+                    args.box_size, args.num_particles)
+    add_stage_time(metrics["stages"], "write_consensus", stage_start)
+    write_metrics(os.path.join(out_dir, ''.join([basename, "_metrics.json"])),
+                  command, metrics, start)
+
+    out_file = os.path.join(out_dir, ''.join(
+        [basename, "_runtime.tsv"]))
+    #	runtime (in seconds), largest CC and number of CCs (if given), solver status, gap
+    values = [time.time() - start]
+    if not components is None:
+        values.extend([np.max(components, initial=0), len(components)])
+    values.extend([get_solver_status(metrics["solver"]), metrics["solver"]["gap"]])
+    with open(out_file, 'a') as o:
+        o.write('\t'.join([str(val) for val in values]) + '\n')
+
+
+def check_solver_arguments(args):
+    """checks the solver arguments shared with the consensus command"""
+    assert(args.solver != "gurobi" or gurobi_available()
+           ), "Error - Gurobi is not installed or licensed (use --solver highs)"
+    assert(args.relaxation_gap is None or args.relaxation_gap >=
+           0), "Error - relaxation gap must be non-negative"
+    assert(args.batch_size is None or args.batch_size >
+           0), "Error - batch size must be a positive integer"
+    assert(args.jobs > 0 and args.cc_jobs >
+           0), "Error - number of jobs must be a positive integer"
+    assert(args.threads_per_solve is None or args.threads_per_solve >
+           0), "Error - number of threads per solve must be a positive integer"
+    assert(args.time_limit is None or args.time_limit >
+           0), "Error - time limit must be positive"
+    assert(args.mip_gap is None or args.mip_gap >=
+           0), "Error - MIP gap must be non-negative"
 
 
 def main(args):
 
     assert(os.path.isdir(args.in_dir)), "Error - input directory is missing"
+    check_solver_arguments(args)
 
-    for matrix_file in glob.glob(os.path.join(args.in_dir, "*_constraint_matrix.pickle")):
-
-        start = time.time()
-        basename = os.path.basename(
-            matrix_file.replace("_constraint_matrix.pickle", ''))
-        print(f"\n--- {basename} ---\n")
-
-        #	load constraint matrix and weight vector
-        with open(matrix_file, 'rb') as f:
-            A = pickle.load(f)
-        weight_file = matrix_file.replace(
-            "_constraint_matrix", "_weight_vector")
-        with open(weight_file, 'rb') as f:
-            w = pickle.load(f)
-        del weight_file
-
-        ###
-        #	set up Gurobi optimizer - https://www.gurobi.com/documentation/9.5/examples/mip1_py.html#subsubsection:mip1.py
-        ###
-
-        #	define model object
-        model = gp.Model("model")
-
-        #	set up constraint matrix
-        #	src: https://www.gurobi.com/documentation/9.5/refman/py_model_addmconstr.html
-        x = model.addMVar(A.shape[1], vtype=GRB.BINARY)
-        b = np.full(A.shape[0], 1)
-        model.addMConstr(A, x, '<', b)
-
-        #	set objective function
-        model.setObjective(gp.quicksum(
-            [x_i * w_i for x_i, w_i in zip(x, w)]), GRB.MAXIMIZE)
-
-        #	optimize model
-        model.optimize()
-
-        #	check that each vertex is only chosen once
-        x = np.array([val.x for val in model.getVars()])
-        assert(np.max(np.sum(A.toarray() * x, axis=1)) ==
-               1), "Error - vertices are assigned to multiple cliques"
-        del model, b, w
-
-        #	load clique coordinates
-        in_file = matrix_file.replace(
-            "_constraint_matrix", "_consensus_coords")
-        with open(in_file, 'rb') as f:
-            coords = pickle.load(f)
-        #	load clique confidences
-        in_file = matrix_file.replace(
-            "_constraint_matrix", "_consensus_confidences")
-        with open(in_file, 'rb') as f:
-            confidences = pickle.load(f)
-        del in_file, f
-
-        multi_out = True if type(coords[0][0]) == str else False
-        if multi_out:
-            labels = coords[0]
-            coords = coords[1:]
-        #	filter coords and clique weights for chosen cliques
-        cliques, confidences = zip(*[(coords[i], confidences[i])
-                                   for i in np.where(x == 1.)[0]])
-        del x
-
-        tmp = len(cliques)
-        if multi_out:
-            #	retain vertices not found in chosen cliques
-            coord_sets = [set([val for val in coord_set if val])
-                          for coord_set in zip(*coords[:])]
-            clique_sets = [set([val for val in clique_set if val])
-                           for clique_set in zip(*cliques[:])]
-            cliques, w = list(cliques), list(confidences)
-            n = len(coord_sets)
-            for i in range(0, n, 1):
-                v = coord_sets[i].difference(clique_sets[i])
-                cliques.extend([get_box_vertex_entry(val, n, i) for val in v])
-                confidences.extend([0.] * len(v))
-            assert(len(cliques) == len(confidences)
-                   ), "Error - missing vertices and / or weights"
-            del coord_sets, clique_sets, n, v
-        del coords
-
-        box_size = str(args.box_size)
-        out_file = matrix_file.replace("_constraint_matrix.pickle",
-                                       ".tsv" if multi_out else ".box")
-        with open(out_file, 'wt') as o:
-            if multi_out:
-                o.write('\t'.join(labels) + '\n')
-                o.write('\n'.join(['\t'.join(['\t'.join([
-                        str(int(np.rint(val[0]))), str(int(np.rint(val[1])))])
-                    if val else "N/A\tN/A" for val in vals] + [str(weight)])
-                    for (vals, weight) in zip(cliques, confidences)]))
-            else:
-                for i, (val, weight) in enumerate(sorted(zip(cliques, confidences),
-                                                         key=lambda x: x[1], reverse=True)):
-                    if (args.num_particles == None) or (i < args.num_particles):
-                        o.write('\t'.join([
-                                str(int(np.rint(val[0]))),
-                                str(int(np.rint(val[1]))),
-                                box_size,
-                                box_size,
-                                str(weight)]) + '\n')
-        del out_file, basename, box_size
-
-        out_file = matrix_file.replace(
-            "_constraint_matrix.pickle", "_runtime.tsv")
-        with open(out_file, 'a') as o:
-            #	runtime (in seconds)
-            o.write(str(time.time() - start) + '\n')
+    in_files = get_ilp_files(args.in_dir)
+    threads = get_solve_threads(args.jobs * args.cc_jobs, args.threads_per_solve)
+    print(f"Solving {len(in_files)} micrographs with {args.jobs} worker(s) x {args.cc_jobs} CC job(s) x",
+          f"{threads if threads > 0 else 'automatic'} solver thread(s)")
+    dataset_start = time.time()
+    summaries = []
+    if args.jobs > 1:
+        #	one group of micrographs per worker (and solver pool), balanced by the
+        #		number of non-zero constraint matrix entries
+        groups = get_job_groups(in_files, [get_ilp_size(val)[0] for val in in_files],
+                                args.jobs)
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(process_micrographs, group, args, threads)
+                       for group in groups]
+            for future in futures:
+                summaries.extend(future.result())
+    else:
+        summaries = process_micrographs(in_files, args, threads)
+
+    runtime = time.time() - dataset_start
+    print(f"\n{len(in_files)} micrographs solved in {runtime:.2f} s",
+          f"({len(in_files) / max(runtime, 1e-10):.2f} micrographs/s)")
+    write_summary(os.path.join(args.in_dir, "non_optimal.tsv"), summaries)
 
 
 if __name__ == '__main__':
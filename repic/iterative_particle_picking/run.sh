@@ -152,24 +152,21 @@ if ! ${USE_MANUAL_LABELS}; then
   cp -s ${SUB_DIR}/${LABEL}/cryolo/BOX/train/*.box ${TMP}/crYOLO/
   cp -s ${SUB_DIR}/${LABEL}/deep/BOX/train/*.box ${TMP}/deepPicker/
   cp -s ${SUB_DIR}/${LABEL}/topaz/BOX/train/*.box ${TMP}/topaz/
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_train.log
-  repic run_ilp ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_train.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_train.log
   rm -rf ${TMP}
   # val consensus
   mkdir -p ${TMP}/{crYOLO,deepPicker,topaz}
   cp -s ${SUB_DIR}/${LABEL}/cryolo/BOX/val/*.box ${TMP}/crYOLO/
   cp -s ${SUB_DIR}/${LABEL}/deep/BOX/val/*.box ${TMP}/deepPicker/
   cp -s ${SUB_DIR}/${LABEL}/topaz/BOX/val/*.box ${TMP}/topaz/
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_val.log
-  repic run_ilp ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_val.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_val.log
   rm -rf ${TMP}
   # test consensus
   mkdir -p ${TMP}/{crYOLO,deepPicker,topaz}
   cp -s ${SUB_DIR}/${LABEL}/cryolo/BOX/test/*.box ${TMP}/crYOLO/
   cp -s ${SUB_DIR}/${LABEL}/deep/BOX/test/*.box ${TMP}/deepPicker/
   cp -s ${SUB_DIR}/${LABEL}/topaz/BOX/test/*.box ${TMP}/topaz/
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_test.log
-  repic run_ilp ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_test.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_test.log
   rm -rf ${TMP}
   if ${GET_SCORE}; then
     python ${REPIC_UTILS}/score_detections.py -g ${REPIC_COORD}/train/${LABEL}/*.box -p ${REPIC_OUT_DIR}/train/*.box &> ${REPIC_OUT_DIR}/score_train.log
@@ -327,24 +324,21 @@ while [ ${i} -lt ${NUM_ROUNDS} ]; do
   cp -fs ${SUB_DIR}/${LABEL}/topaz/BOX/train/*.box ${TMP}/topaz/
   REPIC_OUT_DIR=${SUB_DIR}/${LABEL}/clique_files
   mkdir -p ${REPIC_OUT_DIR}
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_train.log
-  repic run_ilp ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_train.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/train ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_train.log
   rm -rf ${TMP}
   # val consensus
   mkdir -p ${TMP}/{crYOLO,deepPicker,topaz}
   cp -s ${SUB_DIR}/${LABEL}/cryolo/BOX/val/*.box ${TMP}/crYOLO/
   cp -s ${SUB_DIR}/${LABEL}/deep/BOX/val/*.box ${TMP}/deepPicker/
   cp -s ${SUB_DIR}/${LABEL}/topaz/BOX/val/*.box ${TMP}/topaz/
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_val.log
-  repic run_ilp ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_val.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/val ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_val.log
   rm -rf ${TMP}
   # test consensus
   mkdir -p ${TMP}/{crYOLO,deepPicker,topaz}
   cp -s ${SUB_DIR}/${LABEL}/cryolo/BOX/test/*.box ${TMP}/crYOLO/
   cp -s ${SUB_DIR}/${LABEL}/deep/BOX/test/*.box ${TMP}/deepPicker/
   cp -s ${SUB_DIR}/${LABEL}/topaz/BOX/test/*.box ${TMP}/topaz/
-  repic get_cliques ${TMP} ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} &> ${REPIC_OUT_DIR}/clique_test.log
-  repic run_ilp ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/ilp_test.log
+  repic consensus ${TMP} ${REPIC_OUT_DIR}/test ${REPIC_BOX_SIZE} --num_particles ${REPIC_NUM_PARTICLES} &> ${REPIC_OUT_DIR}/consensus_test.log
   rm -rf ${TMP}
   if ${GET_SCORE}; then
     python ${REPIC_UTILS}/score_detections.py -g ${REPIC_COORD}/train/${LABEL}/*.box -p ${REPIC_OUT_DIR}/train/*.box &> ${REPIC_OUT_DIR}/score_train.log
@@ -4,6 +4,8 @@ import argparse
 import repic
 import repic.commands.get_cliques
 import repic.commands.run_ilp
+import repic.commands.consensus
+import repic.commands.metrics
 import repic.commands.iter_config
 import repic.commands.iter_pick
 
@@ -17,6 +19,8 @@ def main():
     module_list = [
         repic.commands.get_cliques,
         repic.commands.run_ilp,
+        repic.commands.consensus,
+        repic.commands.metrics,
         repic.commands.iter_config,
         repic.commands.iter_pick
     ]
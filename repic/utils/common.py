@@ -7,12 +7,15 @@
 from shutil import rmtree
 from pathlib import Path
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from scipy.sparse import csc_matrix
 import time
 import sys
 import pickle
+import resource
 import numpy as np
 import argparse
 import glob
+import io
 import os
 import json
 import subprocess
@@ -20,7 +23,38 @@ import matplotlib.pyplot as plt
 plt.switch_backend('agg')
 
 
-box_id = 0
+#	consensus (clique) file format - magic bytes, little-endian uint64 header length,
+#		JSON header (version, attributes, and dtype / shape / offset of each array),
+#		then raw array buffers aligned for memory-mapping (see write_consensus_file())
+CONSENSUS_MAGIC = b"REPICBIN"
+CONSENSUS_VERSION = 1
+CONSENSUS_ALIGN = 64
+#	particle detections parsed from BOX files - see read_box_file()
+BOX_DTYPE = np.dtype([("x", np.float64), ("y", np.float64), ("w", np.float64),
+                      ("h", np.float64), ("conf", np.float64), ("id", np.int64)])
+
+
+class MicrographContext:
+    """per-micrograph state assigning box IDs unique across its BOX files"""
+
+    def __init__(self, start_id=0):
+        self.next_id = start_id
+
+    def read_box_file(self, in_file, size=None, sigmoid=True):
+        """returns BOX file detections with box IDs following those of previously read files"""
+        boxes = read_box_file(in_file, size=size, start_id=self.next_id,
+                              sigmoid=sigmoid)
+        self.next_id += len(boxes)
+
+        return boxes
+
+
+def add_stage_time(stages, stage, start):
+    """adds the time (in seconds) since start to a stage and returns the current time"""
+    now = time.time()
+    stages[stage] = stages.get(stage, 0.) + now - start
+
+    return now
 
 
 def adjust_plot_attributes(ax, xlabel, ylabel, fontsize=32):
@@ -41,6 +75,11 @@ def adjust_plot_attributes(ax, xlabel, ylabel, fontsize=32):
     ax.grid(color="gray", ls=':', lw=0.5, zorder=-1.)
 
 
+def align_offset(offset, align=CONSENSUS_ALIGN):
+    """returns the smallest multiple of align that is >= offset"""
+    return -(-offset // align) * align
+
+
 def check_float(val):
     """return True if string can be converted to a float"""
     try:
@@ -68,48 +107,25 @@ def del_dir(dir_path):
     return dir_path
 
 
-def get_box_coords(pattern, size=None, return_weights=False):
+def get_box_coords(pattern, size=None, return_weights=False, context=None):
     """parsed particle coordinates file in BOX format and returns coordinates"""
-    #	BOX format description: https://blake.bcm.edu/emanwiki/Eman2OtherFiles
-    global box_id
+    context = MicrographContext() if context is None else context
     # try:
     for i, (in_file) in enumerate(glob.glob(pattern)):
-        with open(in_file, 'rt') as f:
-            #	check for header
-            if check_float(f.readline().rstrip().split()[0]):
-                f.seek(0)
-            X, Y, H, W, weights = zip(*[val.strip().split() for val in f])
+        boxes = context.read_box_file(in_file, size=size)
     assert(i == 0), ' '.join(["Error - multiple BOX files found using pattern:",
                              pattern])
     # except UnboundLocalError:
     #     print("Error - no BOX files found at:", pattern)
     #     sys.exit(-2)
-    #	check_float() handles header if present
-    X = [float(x) for x in X if check_float(x)]
-    Y = [float(y) for y in Y if check_float(y)]
-    weights = [float(val) for val in weights]
-    #	check that weights are probabilities (clique weights will be > 0)
-    if np.min(weights) < 0:
-        #	convert log-likelihood to probability
-        weights = [1. / (1. + np.exp(-1. * val)) for val in weights]
-
-    assert(len(X) == len(Y)), "Error - unequal number of 'x' and 'y' elements"
-
-    if not size is None:
-        X = X[:size]
-        Y = Y[:size]
-        try:
-            weights = weights[:size]
-        except UnboundLocalError:
-            pass  # weights not defined
 
     #	add unique box ID - required for optimal network X clique finding
     if return_weights:
-        coords = [(x, y, weight, i) for i, (x, y, weight)
-                  in enumerate(zip(X, Y, weights), box_id)]
+        coords = list(zip(boxes["x"].tolist(), boxes["y"].tolist(),
+                          boxes["conf"].tolist(), boxes["id"].tolist()))
     else:
-        coords = [(x, y, i) for i, (x, y) in enumerate(zip(X, Y), box_id)]
-    box_id = coords[-1][-1] + 1
+        coords = list(zip(boxes["x"].tolist(), boxes["y"].tolist(),
+                          boxes["id"].tolist()))
 
     return coords
 
@@ -122,6 +138,17 @@ def get_box_vertex_entry(coord, length, index):
     return entry
 
 
+def get_job_groups(items, sizes, jobs):
+    """returns up to jobs groups of items with balanced total sizes (largest items first)"""
+    groups, totals = [[] for _ in range(jobs)], np.zeros(jobs)
+    for i in np.argsort(-np.asarray(sizes), kind="stable"):
+        j = np.argmin(totals)
+        groups[j].append(items[i])
+        totals[j] += sizes[i]
+
+    return [val for val in groups if len(val) > 0]
+
+
 def get_multi_in_coords(in_file, return_weights=False):
     """returns coordinates, labels, and weights for mult_in BOX file"""
     coords, weights = [], []
@@ -138,6 +165,189 @@ def get_multi_in_coords(in_file, return_weights=False):
     return coords, labels, weights
 
 
+def get_peak_rss():
+    """returns the peak resident set size (in MB) of the current process"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #	ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def read_box_file(in_file, size=None, start_id=0, sigmoid=True):
+    """returns particle detections of a BOX file as a structured array (see BOX_DTYPE)"""
+    #	BOX format description: https://blake.bcm.edu/emanwiki/Eman2OtherFiles
+    with open(in_file, 'rt') as f:
+        text = f.read()
+
+    #	skip header and trailing (e.g., CBOX) lines - data lines start with a number
+    start, end = 0, len(text)
+    while start < end:
+        stop = text.find('\n', start)
+        stop = end if stop < 0 else stop
+        line = text[start:stop].split()
+        if line and check_float(line[0]):
+            break
+        start = stop + 1
+    while end > start:
+        stop = max(text.rfind('\n', start, end - 1) + 1, start)
+        line = text[stop:end].split()
+        if line and check_float(line[0]):
+            break
+        end = stop
+    if start >= end:
+        return np.zeros(0, dtype=BOX_DTYPE)
+
+    #	parse all lines at once - BOX files without confidences are set to 1
+    values = np.loadtxt(io.StringIO(text[start:end]), dtype=np.float64, ndmin=2,
+                        max_rows=size)
+    num_cols = values.shape[1]
+    boxes = np.zeros(len(values), dtype=BOX_DTYPE)
+    for i, (key) in enumerate(BOX_DTYPE.names[:min(num_cols, 5)]):
+        boxes[key] = values[:, i]
+    if num_cols < 5:
+        boxes["conf"] = 1.
+    #	check that confidences are probabilities (clique weights will be > 0)
+    elif sigmoid and np.min(boxes["conf"]) < 0:
+        #	convert log-likelihood to probability
+        boxes["conf"] = 1. / (1. + np.exp(-1. * boxes["conf"]))
+    boxes["id"] = np.arange(start_id, start_id + len(boxes))
+
+    return boxes
+
+
+def read_consensus_file(in_file):
+    """returns arrays (memory-mapped, zero-copy) and attributes of a consensus file"""
+    data = np.memmap(in_file, dtype=np.uint8, mode='r')
+    assert(bytes(data[:len(CONSENSUS_MAGIC)]) == CONSENSUS_MAGIC), ' '.join([
+        "Error - not a REPIC consensus file:", in_file])
+    start = len(CONSENSUS_MAGIC) + 8
+    header_len = int(data[len(CONSENSUS_MAGIC):start].view("<u8")[0])
+    header = json.loads(bytes(data[start:start + header_len]).decode("utf-8"))
+    start = align_offset(start + header_len)
+    assert(header["version"] <= CONSENSUS_VERSION), ' '.join([
+        "Error - unsupported consensus file version:", str(header["version"])])
+    arrays = {}
+    for key, val in header["arrays"].items():
+        dtype = np.dtype(val["dtype"])
+        n = int(np.prod(val["shape"])) * dtype.itemsize
+        arrays[key] = data[start + val["offset"]:start + val["offset"] + n].view(
+            dtype).reshape(val["shape"])
+
+    return arrays, header["attrs"]
+
+
+def read_ilp_data(in_file):
+    """returns the ILP data structures of a micrograph written by get_cliques"""
+    if in_file.endswith("_constraint_matrix.pickle"):
+        return read_ilp_pickles(in_file)
+    arrays, attrs = read_consensus_file(in_file)
+    n, nnz = len(arrays["weight_vector"]), len(arrays["constraint_indices"])
+    A = csc_matrix((np.ones(nnz, dtype=np.int64), arrays["constraint_indices"],
+                    arrays["constraint_indptr"]), shape=attrs["constraint_shape"])
+    assert(A.shape[1] == n), "Error - constraint matrix and weight vector do not match"
+
+    return {"w": arrays["weight_vector"], "confidences": arrays["consensus_confidences"],
+            "coords": arrays["consensus_coords"], "ids": arrays["consensus_ids"], "A": A,
+            "multi_out": attrs["multi_out"], "labels": attrs["labels"],
+            "extra_coords": arrays.get("extra_coords"), "extra_ids": arrays.get("extra_ids")}
+
+
+def read_ilp_pickles(matrix_file):
+    """returns the ILP data structures of a micrograph stored as four pickle files"""
+    data = {}
+    for key, label in zip(["A", "w", "coords", "confidences"],
+                          ["constraint_matrix", "weight_vector", "consensus_coords", "consensus_confidences"]):
+        with open(matrix_file.replace("constraint_matrix", label), 'rb') as f:
+            data[key] = pickle.load(f)
+    data["A"] = data["A"].tocsc()
+    n, coords = len(data["w"]), data["coords"]
+    data["multi_out"] = len(coords) > 0 and type(coords[0][0]) == str
+    if data["multi_out"]:
+        #	header of picker names, clique rows, then one row per pick - clique members
+        #		are (x, y, ID) and picks are (x, y, confidence, ID) tuples
+        data["labels"], coords = list(coords[0]), coords[1:]
+        k = len(data["labels"])
+        ids = np.array([[-1 if val is None else val[-1] for val in row]
+                        for row in coords], dtype=np.int64).reshape(-1, k)
+        coords = np.array([[(np.nan, np.nan) if val is None else val[:2] for val in row]
+                           for row in coords], dtype=np.float64).reshape(-1, k, 2)
+        extra_ids = ids[n:]
+        assert(np.all(np.sum(extra_ids >= 0, axis=1) == 1)
+               ), f"Error - malformed vertex rows in {matrix_file}"
+        #	clique members are not reliably sorted by picker in legacy files, so they
+        #		are placed in the picker column of their pick row
+        pickers = dict(zip(np.max(extra_ids, axis=1), np.argmax(extra_ids >= 0, axis=1)))
+        assert(len(pickers) == len(extra_ids)), f"Error - duplicate vertex IDs in {matrix_file}"
+        data["coords"] = np.full((n, k, 2), np.nan)
+        data["ids"] = np.full((n, k), -1, dtype=np.int64)
+        for i, j in zip(*np.where(ids[:n] >= 0)):
+            col = pickers.get(ids[i, j], j)
+            data["coords"][i, col], data["ids"][i, col] = coords[i, j], ids[i, j]
+        #	picks of cliques are listed with the cliques
+        keep = ~np.isin(np.max(extra_ids, axis=1), data["ids"])
+        data["extra_coords"], data["extra_ids"] = coords[n:][keep], extra_ids[keep]
+    else:
+        data["labels"], data["extra_coords"], data["extra_ids"] = None, None, None
+        data["ids"] = np.array([val[-1] for val in coords], dtype=np.int64)
+        data["coords"] = np.array([val[:2] for val in coords],
+                                  dtype=np.float64).reshape(-1, 2)
+
+    return data
+
+
+def write_consensus_file(out_file, arrays, attrs):
+    """writes named arrays and JSON-serializable attributes to a single consensus file"""
+    arrays = {key: np.ascontiguousarray(val) for key, val in arrays.items()}
+    header = {"version": CONSENSUS_VERSION, "attrs": attrs, "arrays": {}}
+    #	array offsets are relative to the (aligned) end of the header
+    offset = 0
+    for key, val in arrays.items():
+        header["arrays"][key] = {"dtype": val.dtype.str, "shape": list(val.shape),
+                                 "offset": offset}
+        offset = align_offset(offset + val.nbytes)
+    encoded = json.dumps(header).encode("utf-8")
+    start = align_offset(len(CONSENSUS_MAGIC) + 8 + len(encoded))
+    with open(out_file, 'wb') as o:
+        o.write(CONSENSUS_MAGIC)
+        o.write(np.array([len(encoded)], dtype="<u8").tobytes())
+        o.write(encoded)
+        for key, val in arrays.items():
+            o.seek(start + header["arrays"][key]["offset"])
+            o.write(val.tobytes())
+        o.truncate(start + offset)
+
+
+def write_ilp_data(out_file, data):
+    """writes the ILP data structures of a micrograph to a single consensus file"""
+    A = data["A"].tocsc()
+    arrays = {"weight_vector": np.asarray(data["w"], dtype=np.float32),
+              "consensus_confidences": np.asarray(data["confidences"], dtype=np.float32),
+              "consensus_coords": np.asarray(data["coords"], dtype=np.float64),
+              "consensus_ids": np.asarray(data["ids"], dtype=np.int64),
+              "constraint_indptr": A.indptr.astype(np.int64),
+              "constraint_indices": A.indices.astype(np.int32)}
+    if data["multi_out"]:
+        arrays["extra_coords"] = np.asarray(
+            data["extra_coords"], dtype=np.float64)
+        arrays["extra_ids"] = np.asarray(data["extra_ids"], dtype=np.int64)
+    write_consensus_file(out_file, arrays, {"multi_out": data["multi_out"], "labels": data["labels"],
+                                            "constraint_shape": [int(val) for val in A.shape]})
+
+
+def write_metrics(out_file, command, metrics, start, **kwargs):
+    """adds the metrics record of a command to the JSON metrics file of a micrograph"""
+    record = {}
+    if os.path.exists(out_file):
+        with open(out_file, 'rt') as f:
+            record = json.load(f)
+    metrics.update(kwargs)
+    metrics.update({"total": time.time() - start,
+                   "peak_rss_mb": get_peak_rss()})
+    record[command] = metrics
+    with open(out_file + ".tmp", 'wt') as o:
+        json.dump(record, o, indent=1, sort_keys=True)
+    os.replace(out_file + ".tmp", out_file)
+
+
 def write_pickle(data, out_file):
     """writes data to storage in Pickle format"""
     with open(out_file, 'wb') as o:
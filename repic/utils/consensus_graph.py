@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+#
+#	consensus_graph.py - compact array-backed (CSR) graph of particle detections
+#
+
+import itertools
+import numpy as np
+
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+class ConsensusGraph:
+    """undirected k-partite graph of particle detections stored as CSR arrays"""
+
+    def __init__(self, sizes, edges, node_weights=None):
+        """builds graph from per-picker detection counts and Jaccard edge arrays of picker pairs"""
+        self.k = len(sizes)
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(sizes)]).astype(np.int32)
+        self.num_nodes = int(self.offsets[-1])
+        #	node IDs are ordered by picker - picker p owns IDs offsets[p] to
+        #		offsets[p + 1] - 1
+        #	picker label of each node
+        self.labels = np.repeat(np.arange(self.k, dtype=np.int32), sizes)
+        self.node_weights = (np.zeros(self.num_nodes) if node_weights is None
+                             else np.asarray(node_weights, dtype=np.float64))
+        assert(len(self.node_weights) ==
+               self.num_nodes), "Error - node weights and nodes are not equal lengths"
+
+        pairs = list(itertools.combinations(range(self.k), 2))
+        assert(len(pairs) == len(edges)
+               ), "Error - edges are not provided for each picker pair"
+        u = np.concatenate([self.offsets[p] + np.asarray(i, dtype=np.int64)
+                            for (p, _), (i, _, _) in zip(pairs, edges)] + [np.empty(0, dtype=np.int64)])
+        v = np.concatenate([self.offsets[q] + np.asarray(j, dtype=np.int64)
+                            for (_, q), (_, j, _) in zip(pairs, edges)] + [np.empty(0, dtype=np.int64)])
+        w = np.concatenate([np.asarray(val, dtype=np.float32)
+                            for (_, _, val) in edges] + [np.empty(0, dtype=np.float32)])
+        self.num_edges = len(w)
+
+        #	store both edge directions, sorted by (source, target)
+        rows, cols = np.concatenate([u, v]), np.concatenate([v, u])
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order].astype(np.int32)
+        self.weights = np.concatenate([w, w])[order]
+        self.indptr = np.searchsorted(
+            rows[order], np.arange(self.num_nodes + 1)).astype(np.int64)
+        #	row-major edge keys (source * num_nodes + target) are sorted for membership tests
+        self.keys = rows[order] * self.num_nodes + cols[order]
+        #	CSR rows are sorted and node IDs are ordered by picker, so each row holds a
+        #		contiguous block of neighbours per picker - retain block offsets per row
+        counts = np.bincount(rows * self.k + self.labels[cols],
+                             minlength=self.num_nodes * self.k).reshape(self.num_nodes, self.k)
+        self.segments = np.zeros((self.num_nodes, self.k + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=self.segments[:, 1:])
+
+    def degree(self):
+        """returns the number of neighbours of each node"""
+        return np.diff(self.indptr)
+
+    def edge_index(self, u, v):
+        """returns the CSR index of each (u, v) edge (-1 if nodes are not connected)"""
+        query = np.asarray(u, dtype=np.int64) * self.num_nodes + v
+        if len(self.keys) == 0:
+            return np.full(query.shape, -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+
+        return np.where(self.keys[idx] == query, idx, -1)
+
+    def has_edges(self, u, v):
+        """returns True for each (u, v) node pair connected by an edge"""
+        return self.edge_index(u, v) >= 0
+
+    def edge_weights(self, u, v):
+        """returns the weights of (u, v) edges (edges are assumed to exist)"""
+        query = np.asarray(u, dtype=np.int64) * self.num_nodes + v
+
+        return self.weights[np.searchsorted(self.keys, query)]
+
+    def neighbour_max(self, nodes, label, values):
+        """returns the maximum of per-edge values over the neighbours with a given picker label"""
+        starts, ends = self.neighbour_ranges(nodes, label)
+        out = np.zeros(len(starts))
+        nonempty = ends > starts
+        if np.any(nonempty):
+            #	reduce over [start, end) ranges - a sentinel keeps end indices in bounds
+            idx = np.column_stack([starts[nonempty], ends[nonempty]]).ravel()
+            out[nonempty] = np.maximum.reduceat(
+                np.append(values, 0.), idx)[::2]
+
+        return out
+
+    def neighbour_ranges(self, nodes, label):
+        """returns the [start, end) CSR ranges of neighbours with a given picker label"""
+        row_starts = self.indptr[nodes]
+
+        return row_starts + self.segments[nodes, label], row_starts + self.segments[nodes, label + 1]
+
+    def connected_components(self):
+        """returns the number of connected components (CCs) and the CC label of each node"""
+        matrix = csr_matrix((np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr),
+                            shape=(self.num_nodes, self.num_nodes))
+        _, cc_labels = connected_components(matrix, directed=False)
+        connected = self.degree() > 0
+        #	relabel CCs of connected nodes in order of their first node
+        _, first, inverse = np.unique(
+            cc_labels[connected], return_index=True, return_inverse=True)
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+        labels = np.full(self.num_nodes, -1, dtype=np.int64)
+        labels[connected] = rank[inverse]
+
+        return len(first), labels
+
+    def component_sizes(self):
+        """returns the number of nodes in each connected component (CC)"""
+        n, labels = self.connected_components()
+
+        return np.bincount(labels[labels >= 0], minlength=n)
+
+    def largest_component(self):
+        """returns a boolean mask of nodes in the largest connected component (CC)"""
+        n, labels = self.connected_components()
+        if n == 0:
+            return np.zeros(self.num_nodes, dtype=bool)
+
+        return labels == np.argmax(np.bincount(labels[labels >= 0], minlength=n))
+
+    def to_networkx(self):
+        """returns graph as a networkx Graph object (for debugging)"""
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from([(u, {"name": int(label), "weight": float(weight)})
+                              for u, (label, weight) in enumerate(zip(self.labels, self.node_weights))])
+        rows = np.repeat(np.arange(self.num_nodes), self.degree())
+        upper = rows < self.indices
+        graph.add_weighted_edges_from(zip(rows[upper].tolist(), self.indices[upper].tolist(),
+                                          self.weights[upper].tolist()))
+
+        return graph
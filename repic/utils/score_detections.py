@@ -9,7 +9,7 @@ import numpy as np
 import os
 import sys
 
-from coord_converter import process_conversion
+from common import read_box_file
 from pathlib import Path
 from tqdm import tqdm
 
@@ -111,19 +111,9 @@ if __name__ == "__main__":
         gt_path = next(f for f in a.g if Path(f).stem.lower() == match)
         pckr_path = next(f for f in a.p if Path(f).stem.lower().startswith(match))
 
-        # process gt and pckr box files
-        gt_dfs = process_conversion([gt_path], "box", "box", out_dir=None, quiet=True)
-        p_dfs = process_conversion([pckr_path], "box", "box", out_dir=None, quiet=True)
-
-        gt_df = list(gt_dfs.values())[0]
-        pckr_df = list(p_dfs.values())[0]
-
-        for df in (gt_df, pckr_df):
-            if "conf" not in df.columns:
-                df["conf"] = 1
-
-        gt_boxes = list(gt_df.itertuples(name="Box", index=False))
-        pckr_boxes = list(pckr_df.itertuples(name="Box", index=False))
+        # process gt and pckr box files (confidences are set to 1 if not provided)
+        gt_boxes = list(read_box_file(gt_path, sigmoid=False).view(np.recarray))
+        pckr_boxes = list(read_box_file(pckr_path, sigmoid=False).view(np.recarray))
 
         precision,recall,f1,pos_frac = get_segmentation_scores(
             gt_boxes, pckr_boxes, conf_thresh=a.c, mrc_w=a.width, mrc_h=a.height
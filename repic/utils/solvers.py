@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+#
+#	solvers.py - ILP solver backends for the consensus set packing problem
+#		(maximize w^T x subject to A x <= 1, x binary)
+#
+
+import os
+import threading
+import time
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+#	available solver backends - "auto" uses Gurobi if it is installed and licensed
+#		and HiGHS (via SciPy) otherwise
+backends = ["gurobi", "highs", "auto"]
+#	tolerance for integral LP solutions and relative gaps
+tolerance = 1e-6
+#	HiGHS (scipy.optimize.milp) status codes
+highs_status = {0: "optimal", 1: "time_limit", 2: "infeasible", 3: "unbounded",
+                4: "other"}
+
+
+class SolverPool:
+    """thread pool of concurrent solves and the Gurobi environments of its threads"""
+
+    def __init__(self, jobs=1):
+        #	solves run in the calling thread for a single job
+        self.executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.local = threading.local()
+        self.environments = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """waits for running solves and disposes the Gurobi environments"""
+        if not self.executor is None:
+            self.executor.shutdown()
+        with self.lock:
+            for env in self.environments:
+                env.dispose()
+            self.environments = []
+
+    def get_env(self):
+        """returns the Gurobi environment of the current thread (None if Gurobi is unavailable)"""
+        if not hasattr(self.local, "env"):
+            #	gurobipy is only required by the Gurobi backend
+            try:
+                import gurobipy as gp
+                self.local.env = gp.Env(params={"OutputFlag": 0})
+            except Exception:
+                self.local.env = None
+            if not self.local.env is None:
+                with self.lock:
+                    self.environments.append(self.local.env)
+
+        return self.local.env
+
+    def map(self, func, vals):
+        """returns an iterator of func applied to vals (in order)"""
+        return map(func, vals) if self.executor is None else self.executor.map(func, vals)
+
+
+def get_solve_threads(workers, threads=None):
+    """returns the number of solver threads per solve of concurrent solves"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+        else os.cpu_count()
+    #	0 lets the solver choose - requested threads are capped by the cores per solve
+    if threads is None:
+        return 0 if workers <= 1 else max(cores // workers, 1)
+
+    return max(min(threads, cores // max(workers, 1)), 1)
+
+
+def get_matching_pairs(A):
+    """returns the vertex pairs of cliques if the problem is a bipartite matching (else None)"""
+    A = A.tocsc()
+    if A.shape[1] == 0 or np.any(np.diff(A.indptr) != 2):
+        return None
+    #	vertices are ordered by picker, so the first vertex of each edge belongs to
+    #		the first picker
+    pairs = np.sort(A.indices.reshape(-1, 2), axis=1)
+    if np.intersect1d(pairs[:, 0], pairs[:, 1]).size > 0:
+        return None
+
+    return pairs
+
+
+def get_status_name(status):
+    """returns the (lowercase) name of a Gurobi optimization status code"""
+    from gurobipy import GRB
+
+    for key in dir(GRB.Status):
+        if key.isupper() and getattr(GRB.Status, key) == status:
+            return key.lower()
+
+    return str(status)
+
+
+def get_gap(objective, bound):
+    """returns the relative gap of an objective value to an upper bound"""
+    if bound - objective <= tolerance * max(abs(bound), 1.):
+        return 0.
+
+    return (bound - objective) / max(abs(objective), 1e-10)
+
+
+def greedy_packing(A, priority):
+    """returns binary clique selection vector x of the greedy packing by priority"""
+    A = A.tocsc()
+    n = A.shape[1]
+    counts = np.diff(A.indptr)
+    rows, cols = A.indices, np.repeat(np.arange(n), counts)
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(-np.asarray(priority), kind="stable")] = np.arange(n)
+    alive = np.asarray(priority) > 0
+    x = np.zeros(n)
+    best = np.empty(A.shape[0], dtype=np.int64)
+    while np.any(alive):
+        #	a clique is chosen if it has the highest priority of the remaining cliques
+        #		of all its vertices - the result equals a sequential greedy pass
+        entries = alive[cols]
+        best.fill(n)
+        np.minimum.at(best, rows[entries], rank[cols[entries]])
+        found = np.bincount(cols, weights=best[rows] == rank[cols], minlength=n)
+        selected = alive & (found == counts)
+        x[selected] = 1.
+        #	remove cliques sharing a vertex with the chosen cliques
+        used = np.zeros(A.shape[0], dtype=bool)
+        used[rows[selected[cols]]] = True
+        alive &= np.bincount(cols, weights=used[rows], minlength=n) == 0
+
+    return x
+
+
+def gurobi_available():
+    """returns True if gurobipy can be imported and a Gurobi environment started"""
+    with SolverPool() as pool:
+        return not pool.get_env() is None
+
+
+def get_limit_status(status, gap, mip_gap=None):
+    """returns the status of a solve that was reported optimal within a requested MIP gap limit"""
+    return "gap_limit" if status == "optimal" and not mip_gap is None and gap > tolerance \
+        else status
+
+
+def solve_greedy(A, w, bound=None):
+    """returns clique selection vector x and solver statistics of the greedy packing by weight"""
+    start = time.time()
+    w = np.asarray(w, dtype=np.float64)
+    x = greedy_packing(A, w)
+    bound = np.nan if bound is None or not np.isfinite(bound) else bound
+
+    return x, {"build": 0., "solve": time.time() - start, "backend": "greedy",
+               "status": "time_limit", "nodes": 0, "gap": get_gap(np.dot(w, x), bound),
+               "bound": bound}
+
+
+def solve_gurobi(A, w, threads=0, time_limit=None, mip_gap=None, env=None):
+    """returns binary clique selection vector x and solver statistics using Gurobi"""
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    start = time.time()
+    ###
+    #	set up Gurobi optimizer - https://www.gurobi.com/documentation/9.5/examples/mip1_py.html#subsubsection:mip1.py
+    ###
+
+    #	define model object - one Gurobi environment per thread (see SolverPool)
+    model = gp.Model("model", env=env)
+    model.Params.Threads = threads
+    if not time_limit is None:
+        model.Params.TimeLimit = time_limit
+    if not mip_gap is None:
+        model.Params.MIPGap = mip_gap
+
+    #	set up constraint matrix
+    #	src: https://www.gurobi.com/documentation/9.5/refman/py_model_addmconstr.html
+    x = model.addMVar(A.shape[1], vtype=GRB.BINARY)
+    b = np.full(A.shape[0], 1)
+    model.addMConstr(A, x, '<', b)
+
+    #	set objective function from the weight vector (single linear expression)
+    model.setObjective(np.asarray(w, dtype=np.float64) @ x, GRB.MAXIMIZE)
+
+    #	optimize model
+    stats = {"build": time.time() - start, "backend": "gurobi"}
+    start = time.time()
+    try:
+        model.optimize()
+        status = get_status_name(model.Status)
+        if model.SolCount > 0:
+            #	fetch solution as a single array
+            x, gap = np.rint(x.X), model.MIPGap
+        else:
+            x = greedy_packing(A, w)
+            gap = get_gap(np.dot(w, x), model.ObjBound)
+        stats.update({"solve": time.time() - start, "status": get_limit_status(status, gap, mip_gap),
+                      "nodes": model.NodeCount, "gap": gap, "bound": model.ObjBound,
+                      #	MaxMemUsed is the peak of the (reused) environment, not of this model
+                      "post_solve_memory_mb": model.MemUsed * 1024.})
+    finally:
+        model.dispose()
+
+    return x, stats
+
+
+def solve_highs(A, w, time_limit=None, mip_gap=None):
+    """returns binary clique selection vector x and solver statistics using HiGHS"""
+    start = time.time()
+    #	milp minimizes, so the weights are negated
+    c = -np.asarray(w, dtype=np.float64)
+    constraints = LinearConstraint(A, -np.inf, 1.)
+    options = {key: val for key, val in [("time_limit", time_limit), ("mip_rel_gap", mip_gap)]
+               if not val is None}
+    stats = {"build": time.time() - start, "backend": "highs"}
+    start = time.time()
+    res = milp(c, constraints=constraints, integrality=np.ones(len(c)),
+               bounds=Bounds(0., 1.), options=options)
+    x = greedy_packing(A, -c) if res.x is None else np.rint(res.x)
+    bound = getattr(res, "mip_dual_bound", None)
+    bound = np.dot(-c, x) if bound is None else -bound
+    gap = get_gap(np.dot(-c, x), bound) if res.x is None else getattr(res, "mip_gap", 0.) or 0.
+    stats.update({"solve": time.time() - start,
+                  "status": get_limit_status(highs_status.get(res.status, str(res.status)), gap,
+                                                    mip_gap),
+                  "nodes": getattr(res, "mip_node_count", 0) or 0, "gap": gap, "bound": bound})
+
+    return x, stats
+
+
+def solve_matching(A, w, pairs=None):
+    """returns binary clique selection vector x and solver statistics of a bipartite matching"""
+    start = time.time()
+    w = np.asarray(w, dtype=np.float64)
+    pairs = get_matching_pairs(A) if pairs is None else pairs
+    x = np.zeros(len(w))
+    #	only edges of positive weight can be part of a maximum weight matching
+    cols = np.where(w > 0)[0]
+    left, left_idx = np.unique(pairs[cols, 0], return_inverse=True)
+    right, right_idx = np.unique(pairs[cols, 1], return_inverse=True)
+    n_left, n_right = len(left), len(right)
+    if len(cols) > 0:
+        #	reduce maximum weight matching to a full matching by adding a dummy partner
+        #		per vertex and mirrored edges between dummies of matched vertices - all
+        #		full matchings have n_left + n_right edges, so shifting costs to be
+        #		positive (explicit zeros are not edges) does not change the optimum
+        cost = np.max(w[cols]) + 1.
+        dummy_left, dummy_right = np.arange(n_left), np.arange(n_right)
+        rows = np.concatenate([left_idx, dummy_left, n_left + dummy_right,
+                               n_left + right_idx])
+        targets = np.concatenate([right_idx, n_right + dummy_left, dummy_right,
+                                  n_right + left_idx])
+        costs = np.concatenate([cost - w[cols], np.full(n_left + n_right + len(cols), cost)])
+        size = n_left + n_right
+        _, matching = min_weight_full_bipartite_matching(
+            csr_matrix((costs, (rows, targets)), shape=(size, size)))
+        x[cols] = matching[left_idx] == right_idx
+    objective = np.dot(w, x)
+
+    return x, {"build": 0., "solve": time.time() - start, "backend": "matching",
+               "status": "optimal", "nodes": 0, "gap": 0., "bound": objective}
+
+
+def solve_relaxation(A, w, gap=0., time_limit=None):
+    """returns clique selection vector x (None if rejected) and statistics of the LP relaxation"""
+    start = time.time()
+    w = np.asarray(w, dtype=np.float64)
+    res = linprog(-w, A_ub=A, b_ub=np.ones(A.shape[0]), bounds=(0., 1.), method="highs",
+                  options={} if time_limit is None else {"time_limit": time_limit})
+    stats = {"build": 0., "nodes": 0, "status": "optimal"}
+    if res.status != 0:
+        stats.update({"solve": time.time() - start, "backend": "lp",
+                      "gap": np.inf, "bound": np.inf})
+        return None, stats
+    bound = -res.fun
+    if np.all(np.minimum(res.x, 1. - res.x) <= tolerance):
+        #	integral LP solutions are optimal
+        x = np.rint(res.x)
+        stats.update({"solve": time.time() - start, "backend": "lp",
+                      "gap": get_gap(np.dot(w, x), bound), "bound": bound})
+        return x, stats
+
+    #	greedy packing by weight and by rounded LP solution (ties broken by weight)
+    candidates = [greedy_packing(A, w),
+                  greedy_packing(A, res.x + tolerance * w / max(np.max(w), 1e-10))]
+    x = max(candidates, key=lambda val: np.dot(w, val))
+    stats.update({"solve": time.time() - start, "backend": "greedy",
+                  "gap": get_gap(np.dot(w, x), bound), "bound": bound})
+    if stats["gap"] > gap:
+        return None, stats
+    if stats["gap"] > 0.:
+        stats["status"] = "gap_limit"
+
+    return x, stats
+
+
+def solve_mip(A, w, solver="auto", relaxation_gap=None, threads=0, time_limit=None,
+              mip_gap=None, pool=None):
+    """returns binary clique selection vector x and solver statistics of the given backend"""
+    assert(solver in backends), f"Error - unknown ILP solver: {solver}"
+    if pool is None:
+        with SolverPool() as pool:
+            return solve_mip(A, w, solver, relaxation_gap, threads, time_limit, mip_gap, pool)
+    start = time.time()
+    #	two-picker problems are solved exactly without an ILP solver
+    pairs = get_matching_pairs(A)
+    if not pairs is None:
+        return solve_matching(A, w, pairs)
+    if not time_limit is None and time_limit <= 0:
+        return solve_greedy(A, w)
+    relaxation_time = 0.
+    if not relaxation_gap is None:
+        x, stats = solve_relaxation(A, w, relaxation_gap, time_limit)
+        if not x is None:
+            return x, stats
+        relaxation_time = stats["solve"]
+        if not time_limit is None:
+            time_limit -= time.time() - start
+            if time_limit <= 0:
+                x, stats = solve_greedy(A, w, stats["bound"])
+                stats["solve"] += relaxation_time
+                return x, stats
+
+    env = None if solver == "highs" else pool.get_env()
+    assert(solver != "gurobi" or not env is None
+           ), "Error - Gurobi is not installed or licensed (use --solver highs)"
+    if env is None:
+        x, stats = solve_highs(A, w, time_limit, mip_gap)
+    elif solver == "gurobi":
+        x, stats = solve_gurobi(A, w, threads, time_limit, mip_gap, env)
+    else:
+        import gurobipy as gp
+        try:
+            x, stats = solve_gurobi(A, w, threads, time_limit, mip_gap, env)
+        except gp.GurobiError:
+            #	e.g., size-limited licenses that do not cover the model
+            x, stats = solve_highs(A, w, time_limit, mip_gap)
+    if stats["status"] == "time_limit":
+        #	early incumbents may be worse than the greedy packing
+        candidate = greedy_packing(A, w)
+        if np.dot(w, candidate) > np.dot(w, x):
+            x = candidate
+            stats["gap"] = get_gap(np.dot(w, x), stats["bound"])
+    #	time spent on rejected relaxations is part of the solve time
+    stats["solve"] += relaxation_time
+
+    return x, stats
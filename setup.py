@@ -21,13 +21,20 @@ REQUIRES_PYTHON = ">=3.8.16"
 REQUIRED = [
     "matplotlib>=3.2.2",
     "mrcfile>=1.4.3",
-    "networkx>=2.8.4",
     "numpy>=1.24.2",
     "pandas",
     "scipy>=1.10.0",
     "tqdm"
 ]
 
+# optional packages
+EXTRAS = {
+    # networkx clique enumeration (get_cliques --networkx) for debugging
+    "debug": ["networkx>=2.8.4"],
+    # Gurobi ILP solver backend (run_ilp / consensus --solver gurobi)
+    "gurobi": ["gurobipy>=9.5.2"]
+}
+
 work_dir = os.path.abspath(os.path.dirname(__file__))
 
 # import README and use as the long-description
@@ -59,6 +66,7 @@ setup(
         "console_scripts": ["repic=repic.main:main"],
     },
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     license='BSD-3-Clause',
     classifiers=[
         "License :: OSI Approved :: BSD License",